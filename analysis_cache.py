@@ -0,0 +1,260 @@
+"""
+Analysis Cache for Music Assistant
+Persistent analyzer results in the sample_analysis table, keyed by
+audio content hash plus analyzer version
+"""
+
+import json
+import hashlib
+import sqlite3
+import fingerprint
+from profiling import stage
+
+DEFAULT_DB = "music_assistant.db"
+
+# Result fields stored under the JSON keys the Electron side already
+# queries ($.bpm, $.primary); everything else lands in spectral_data
+FIELD_COLUMNS = {
+    "tempo": ("tempo_data", "bpm"),
+    "key": ("harmonic_data", "key"),
+    "key_index": ("harmonic_data", "key_index"),
+    "mode": ("harmonic_data", "mode"),
+    "key_confidence": ("harmonic_data", "confidence"),
+    "mood": ("mood_data", "primary"),
+}
+DEFAULT_COLUMN = "spectral_data"
+JSON_COLUMNS = ("tempo_data", "harmonic_data", "mood_data", "spectral_data")
+
+# Per-request fields that are not a property of the audio content
+TRANSIENT_FIELDS = ("file", "cached", "duplicate_of", "profile")
+
+def content_hash(file_path, chunk_size=1 << 20):
+    """SHA-1 of the file bytes, read in chunks"""
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def analyzer_version(name, version, *source_files):
+    """Version tag that also changes whenever the analyzer source or librosa changes"""
+    import librosa
+
+    digest = hashlib.sha1(librosa.__version__.encode())
+    for path in source_files:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return f"{name}/{version}-{digest.hexdigest()[:8]}"
+
+def result_to_columns(result):
+    """Split an analyzer result dict into sample_analysis JSON column values"""
+    columns = {name: {} for name in JSON_COLUMNS}
+    for field, value in result.items():
+        if field in TRANSIENT_FIELDS:
+            continue
+        column, key = FIELD_COLUMNS.get(field, (DEFAULT_COLUMN, field))
+        columns[column][key] = value
+    return {name: json.dumps(values) for name, values in columns.items()}
+
+def columns_to_result(row):
+    """Rebuild an analyzer result dict from sample_analysis JSON columns"""
+    reverse = {(column, key): field for field, (column, key) in FIELD_COLUMNS.items()}
+    result = {}
+    for column in JSON_COLUMNS:
+        for key, value in json.loads(row[column] or "{}").items():
+            result[reverse.get((column, key), key)] = value
+    return result
+
+def ensure_schema(conn):
+    """Create sample_analysis if needed and add the cache key and fingerprint columns/tables"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sample_analysis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sample_id INTEGER,
+            audio_fingerprint TEXT,
+            pitch_data TEXT,
+            tempo_data TEXT,
+            harmonic_data TEXT,
+            mood_data TEXT,
+            genre_data TEXT,
+            spectral_data TEXT,
+            stem_data TEXT,
+            ai_description TEXT,
+            auto_tags TEXT,
+            similarity_scores TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (sample_id) REFERENCES tracks (id)
+        )
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sample_analysis)")}
+    for name in ("content_hash", "analyzer_version"):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE sample_analysis ADD COLUMN {name} TEXT")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sample_analysis_content "
+        "ON sample_analysis (content_hash, analyzer_version)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sample_analysis_fingerprint ON sample_analysis (audio_fingerprint)"
+    )
+    # LSH buckets of each content's fingerprint, for near-duplicate lookup
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fingerprint_buckets (
+            band INTEGER,
+            bucket TEXT,
+            content_hash TEXT
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_fingerprint_buckets ON fingerprint_buckets (band, bucket)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_fingerprint_buckets_content ON fingerprint_buckets (content_hash)"
+    )
+    conn.commit()
+
+class AnalysisCache:
+    def __init__(self, db_path=DEFAULT_DB):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        ensure_schema(self.conn)
+
+    def get(self, digest, version):
+        """Return the cached result for this content and analyzer version, or None"""
+        row = self.conn.execute(
+            "SELECT tempo_data, harmonic_data, mood_data, spectral_data FROM sample_analysis "
+            "WHERE content_hash = ? AND analyzer_version = ? ORDER BY updated_at DESC LIMIT 1",
+            (digest, version)
+        ).fetchone()
+        return columns_to_result(row) if row else None
+
+    def find_duplicate(self, signature, version, threshold=fingerprint.REUSE_SIMILARITY):
+        """(result, content_hash) of the closest stored audio for this fingerprint, or None.
+
+        Identical fingerprints are found through the column index; near-duplicates
+        only through shared LSH buckets, never by scanning every fingerprint.
+        """
+        columns = "content_hash, audio_fingerprint, tempo_data, harmonic_data, mood_data, spectral_data"
+        row = self.conn.execute(
+            f"SELECT {columns} FROM sample_analysis WHERE audio_fingerprint = ? AND analyzer_version = ? "
+            "ORDER BY updated_at DESC LIMIT 1",
+            (fingerprint.encode(signature), version)
+        ).fetchone()
+        if row:
+            return columns_to_result(row), row["content_hash"]
+
+        candidates = set()
+        for band, bucket in fingerprint.band_buckets(signature):
+            candidates.update(r[0] for r in self.conn.execute(
+                "SELECT content_hash FROM fingerprint_buckets WHERE band = ? AND bucket = ?", (band, bucket)
+            ))
+        if not candidates:
+            return None
+
+        best, best_score = None, threshold
+        candidates = list(candidates)
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(candidates), 500):
+            chunk = candidates[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.conn.execute(
+                f"SELECT {columns} FROM sample_analysis WHERE analyzer_version = ? "
+                f"AND content_hash IN ({placeholders}) AND audio_fingerprint IS NOT NULL",
+                (version, *chunk)
+            ):
+                score = fingerprint.similarity(signature, fingerprint.decode(row["audio_fingerprint"]))
+                if score >= best_score:
+                    best, best_score = row, score
+        return (columns_to_result(best), best["content_hash"]) if best else None
+
+    def put(self, digest, version, result, signature=None):
+        """Store a successful result (and its fingerprint), replacing any earlier unlinked entry"""
+        if "error" in result:
+            return
+        columns = result_to_columns(result)
+        encoded = fingerprint.encode(signature) if signature is not None else None
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM sample_analysis "
+                "WHERE content_hash = ? AND analyzer_version = ? AND sample_id IS NULL",
+                (digest, version)
+            )
+            self.conn.execute(
+                "INSERT INTO sample_analysis (content_hash, analyzer_version, audio_fingerprint, "
+                "tempo_data, harmonic_data, mood_data, spectral_data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, version, encoded, columns["tempo_data"], columns["harmonic_data"],
+                 columns["mood_data"], columns["spectral_data"])
+            )
+            if signature is not None:
+                self.conn.execute("DELETE FROM fingerprint_buckets WHERE content_hash = ?", (digest,))
+                self.conn.executemany(
+                    "INSERT INTO fingerprint_buckets (band, bucket, content_hash) VALUES (?, ?, ?)",
+                    [(band, bucket, digest) for band, bucket in fingerprint.band_buckets(signature)]
+                )
+
+    def prune(self, version):
+        """Delete unlinked entries written by older versions of the same analyzer.
+
+        Entries of the same version in another input mode (a "+..." suffix,
+        e.g. read through a PCM cache) are kept.
+        """
+        name = version.split("/", 1)[0]
+        base = version.split("+", 1)[0]
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM sample_analysis WHERE content_hash IS NOT NULL AND sample_id IS NULL "
+                "AND analyzer_version LIKE ? AND analyzer_version != ? AND analyzer_version NOT LIKE ?",
+                (f"{name}/%", base, f"{base}+%")
+            )
+            self.conn.execute(
+                "DELETE FROM fingerprint_buckets WHERE content_hash NOT IN "
+                "(SELECT content_hash FROM sample_analysis WHERE content_hash IS NOT NULL)"
+            )
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
+
+    def cached(self, file_path, version, analyze, dedupe=False, load=None):
+        """Return analyze(file_path), served from the cache when the content is unchanged.
+
+        With dedupe, the file is fingerprinted first and the stored result of a
+        near-identical copy is reused (marked with duplicate_of). load(file_path)
+        returns (y, sr), or None when the file shouldn't be decoded whole; the
+        audio is then decoded once, fingerprinted, and passed on as
+        analyze(file_path, (y, sr)).
+        """
+        with stage("content_hash"):
+            digest = content_hash(file_path)
+        with stage("cache_lookup"):
+            result = self.get(digest, version)
+        if result is not None:
+            result["cached"] = True
+            return result
+
+        audio = signature = None
+        if dedupe:
+            try:
+                audio = load(file_path) if load is not None else None
+                with stage("fingerprint"):
+                    signature = (fingerprint.fingerprint_audio(*audio) if audio is not None
+                                 else fingerprint.fingerprint_file(file_path))
+            except Exception:
+                audio = signature = None  # undecodable; analyze() reports the error
+        if signature is not None:
+            with stage("dedupe_lookup"):
+                match = self.find_duplicate(signature, version)
+            if match is not None:
+                result, original = match
+                with stage("cache_store"):
+                    self.put(digest, version, result, signature)
+                result["cached"] = True
+                result["duplicate_of"] = original
+                return result
+
+        result = analyze(file_path, audio) if audio is not None else analyze(file_path)
+        with stage("cache_store"):
+            self.put(digest, version, result, signature)
+        return result
@@ -0,0 +1,131 @@
+"""
+Analysis Writer for Music Assistant
+Writes analyzer results straight into the tracks and sample_analysis tables
+in batched transactions, instead of one JSON array for the Electron side to insert
+"""
+
+import os
+import time
+import sqlite3
+from analysis_cache import DEFAULT_DB, ensure_schema, result_to_columns
+from key_detection import PITCH_CLASSES
+
+# Results per executemany batch, and the longest a result waits for its commit
+BATCH_SIZE = 200
+COMMIT_INTERVAL = 2.0
+
+def track_key(result):
+    """tracks.key text for a result: the detected key name, else the strongest pitch class"""
+    if result.get("key"):
+        return result["key"]
+    if result.get("key_index") is not None:
+        return PITCH_CLASSES[result["key_index"]]
+    return None
+
+def version_pattern(version):
+    """LIKE pattern for rows from any version of an analyzer (e.g. analyze_audio/%)"""
+    return f"{version.split('/', 1)[0]}/%"
+
+class AnalysisWriter:
+    """Batched writer of analyzer results; fast-tier results are recorded under fast_version when given"""
+
+    def __init__(self, version, db_path=DEFAULT_DB, batch_size=BATCH_SIZE,
+                 commit_interval=COMMIT_INTERVAL, fast_version=None):
+        self.db_path = db_path
+        self.version = version
+        self.fast_version = fast_version or version
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.pending = []
+        self.last_commit = time.time()
+        self.stats = {"written": 0, "failed": []}
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        # WAL lets the Electron side keep reading while a scan writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT,
+                filepath TEXT,
+                genre TEXT,
+                mood TEXT,
+                bpm INTEGER,
+                key TEXT,
+                notes TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_filepath ON tracks (filepath)")
+        ensure_schema(self.conn)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sample_analysis_sample_id ON sample_analysis (sample_id)")
+
+    def add(self, result):
+        """Queue one result; the batch is written once it is full or COMMIT_INTERVAL has passed"""
+        if "error" in result:
+            self.stats["failed"].append({"file": result.get("file"), "error": result["error"]})
+        else:
+            self.pending.append(result)
+        if len(self.pending) >= self.batch_size or time.time() - self.last_commit >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        """Upsert the queued results in one transaction"""
+        batch, self.pending = self.pending, []
+        self.last_commit = time.time()
+        if not batch:
+            return
+
+        # sqlite3 keeps each statement below prepared; executemany rebinds it per row
+        with self.conn:
+            paths = [result["file"] for result in batch]
+            track_ids = self._track_ids(paths)
+            self.conn.executemany(
+                "INSERT INTO tracks (filename, filepath) VALUES (?, ?)",
+                [(os.path.basename(path), path) for path in dict.fromkeys(paths) if path not in track_ids]
+            )
+            track_ids.update(self._track_ids([path for path in paths if path not in track_ids]))
+
+            self.conn.executemany(
+                "UPDATE tracks SET bpm = ?, key = ?, mood = ? WHERE filepath = ?",
+                [(round(result["tempo"]) if result.get("tempo") is not None else None,
+                  track_key(result), result.get("mood"), result["file"]) for result in batch]
+            )
+
+            # One analyzer row per track: replace this analyzer's earlier row, keep others'
+            rows = []
+            for result in batch:
+                columns = result_to_columns(result)
+                version = self.fast_version if result.get("tier") == "fast" else self.version
+                rows.append((track_ids[result["file"]], version, columns["tempo_data"],
+                             columns["harmonic_data"], columns["mood_data"], columns["spectral_data"]))
+            self.conn.executemany(
+                "DELETE FROM sample_analysis WHERE sample_id = ? AND analyzer_version LIKE ?",
+                [(row[0], version_pattern(row[1])) for row in rows]
+            )
+            self.conn.executemany(
+                "INSERT INTO sample_analysis (sample_id, analyzer_version, "
+                "tempo_data, harmonic_data, mood_data, spectral_data) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        self.stats["written"] += len(batch)
+
+    def _track_ids(self, paths):
+        """filepath -> lowest tracks.id for the given paths"""
+        ids = {}
+        paths = list(dict.fromkeys(paths))
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for track_id, path in self.conn.execute(
+                f"SELECT MIN(id), filepath FROM tracks WHERE filepath IN ({placeholders}) GROUP BY filepath",
+                chunk
+            ):
+                ids[path] = track_id
+        return ids
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+        return self.stats
@@ -1,30 +1,399 @@
-import sys, json, librosa
+import sys, json, os, argparse
+from functools import partial
+from analysis_cache import AnalysisCache, DEFAULT_DB, analyzer_version
+from analysis_writer import AnalysisWriter
+from scan_jobs import ScanJobs, MAX_ATTEMPTS
+from feature_extractor import AudioFeatures, ExcerptFeatures, load_features, should_stream, use_excerpts
+from pcm_cache import PCMCache, DEFAULT_MAX_BYTES as PCM_CACHE_MAX_BYTES
+import feature_extractor
+import key_detection
+import profiling
+import scheduler
 
-def analyze_file(file_path):
+ANALYZER_VERSION = analyzer_version("analyze_audio", 3, __file__, feature_extractor.__file__,
+                                    key_detection.__file__)
+FAST_ANALYZER_VERSION = analyzer_version("analyze_audio_fast", 2, __file__, feature_extractor.__file__,
+                                         key_detection.__file__)
+
+def analyzer_versions(pcm_cache=None):
+    """(full, fast) analyzer versions; audio read through a PCM cache may be downsampled, so it gets its own"""
+    if pcm_cache is None:
+        return ANALYZER_VERSION, FAST_ANALYZER_VERSION
+    return pcm_cache.version(ANALYZER_VERSION), pcm_cache.version(FAST_ANALYZER_VERSION)
+
+# --tier auto escalates fast results below this confidence to the full analysis
+FAST_CONFIDENCE_THRESHOLD = 0.8
+
+# Per-process cache handles, set by init_cache (also used as the pool initializer)
+_cache = None
+_dedupe = False
+_pcm_cache = None
+
+def init_cache(db_path, dedupe=False, pcm_cache=None):
+    """Open the analysis cache for this process and read audio through pcm_cache; None disables either.
+
+    Any cache opened by an earlier call is closed (warm assist.py calls this per request).
+    """
+    global _cache, _dedupe, _pcm_cache
+    if _cache is not None:
+        _cache.close()
+    _cache = AnalysisCache(db_path) if db_path else None
+    _dedupe = dedupe
+    _pcm_cache = pcm_cache
+
+def load_audio(file_path, streaming=None):
+    """(y, sr) for --dedupe to fingerprint and then analyze, or None for files analyzed block-wise"""
+    if should_stream(file_path, streaming):
+        return None
+    features = AudioFeatures.from_file(file_path, pcm_cache=_pcm_cache)
+    return features.y, features.sr
+
+def analyze_file(file_path, audio=None, streaming=None):
     try:
-        y, sr = librosa.load(file_path, sr=None)
-        
-        # Estimate tempo (BPM)
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
+        if audio is not None:
+            features = AudioFeatures(*audio)
+        else:
+            features = load_features(file_path, streaming=streaming, pcm_cache=_pcm_cache)
+        key = features.key()
 
-        # Estimate key
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        key = chroma.mean(axis=1).argmax()
+        return {
+            "file": file_path,
+            "tempo": round(features.tempo(), 2),
+            "key": key["key"],
+            "key_index": key["tonic"],
+            "mode": key["mode"],
+            "key_confidence": key["confidence"],
+            "mood": features.mood(),
+            # Summary features for the similarity index
+            "chroma": [round(float(v), 4) for v in features.chroma_mean()],
+            "mfcc": [round(float(v), 3) for v in features.mfcc_mean()],
+            "centroid": round(features.centroid(), 1),
+            "bandwidth": round(features.bandwidth(), 1),
+            "rms": round(features.rms(), 5)
+        }
+    except Exception as e:
+        return {"file": file_path, "error": str(e)}
 
-        # Crude mood detection: energy vs. chill
-        rms = librosa.feature.rms(y=y).mean()
-        mood = "energetic" if rms > 0.02 else "chill"
+def analyze_fast(file_path, audio=None):
+    """Tempo, key and mood from a few low-rate excerpts, with their agreement as confidence"""
+    try:
+        if audio is not None:
+            features = ExcerptFeatures.from_pcm(*audio)
+        else:
+            features = ExcerptFeatures.from_file(file_path, pcm_cache=_pcm_cache)
+        key = features.key()
 
         return {
             "file": file_path,
-            "tempo": round(float(tempo), 2),
-            "key_index": int(key),
-            "mood": mood
+            "tempo": round(features.tempo(), 2),
+            "key": key["key"],
+            "key_index": key["tonic"],
+            "mode": key["mode"],
+            "key_confidence": key["confidence"],
+            "mood": features.mood(),
+            "confidence": round(features.confidence(), 3),
+            "tier": "fast"
         }
     except Exception as e:
         return {"file": file_path, "error": str(e)}
 
-if __name__ == "__main__":
-    files = json.loads(sys.argv[1])
-    results = [analyze_file(f) for f in files]
+def run_cached(file_path, version, analyze, streaming=None):
+    """analyze(file_path), skipping the decode when the cache has this content and analyzer version"""
+    if _cache is None:
+        return analyze(file_path)
+    try:
+        result = _cache.cached(file_path, version, analyze, dedupe=_dedupe,
+                               load=partial(load_audio, streaming=streaming))
+    except OSError as e:
+        return {"file": file_path, "error": str(e)}
+    result["file"] = file_path
+    return result
+
+def analyze_cached(file_path, streaming=None, tier="full", profile=False):
+    """Analyze one file in the given tier; with profile, the result carries its per-stage timings"""
+    with profiling.profiled(profile) as recorded:
+        result = analyze_tier(file_path, streaming, tier)
+    if recorded is not None:
+        result["profile"] = recorded.report()
+    return result
+
+def scan_file(file_path, **options):
+    """analyze_cached for one file of a background scan, after waiting out any interactive work"""
+    scheduler.checkpoint("scan")
+    return analyze_cached(file_path, **options)
+
+def analyze_tier(file_path, streaming=None, tier="full"):
+    """Analyze one file in the given tier ("full", "fast", or "auto": fast, escalating when unsure).
+
+    Files too short to sample excerpts from get the full analysis in every tier.
+    """
+    full_version, fast_version = analyzer_versions(_pcm_cache)
+    if tier != "full" and use_excerpts(file_path):
+        result = run_cached(file_path, fast_version, analyze_fast)
+        if tier == "fast" or result.get("confidence", 0) >= FAST_CONFIDENCE_THRESHOLD:
+            return result
+
+    result = run_cached(file_path, full_version, partial(analyze_file, streaming=streaming), streaming)
+    if tier != "full":
+        result["tier"] = "full"
+    return result
+
+def read_file_list(source):
+    """Yield paths from a list file (one per line), or from stdin when source is '-'"""
+    stream = sys.stdin if source == "-" else open(source, "r")
+    try:
+        for line in stream:
+            path = line.strip()
+            if path:
+                yield path
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def iter_results(files, workers=None, cache_db=None, streaming=None, dedupe=False, tier="full",
+                 profile=False, pcm_cache=None):
+    """Yield analysis results across a process pool, in completion order.
+
+    The scan runs under a background scheduler lease, and each worker checks
+    in with the scheduler between files, so interactive requests go first.
+    """
+    workers = workers or os.cpu_count() or 1
+    analyze = partial(scan_file, streaming=streaming, tier=tier, profile=profile)
+
+    if workers == 1:
+        init_cache(cache_db, dedupe, pcm_cache)
+        with scheduler.slot("scan"):
+            yield from map(analyze, files)
+        return
+
+    pool, pids = scheduler.worker_pool(workers, initializer=init_cache, initargs=(cache_db, dedupe, pcm_cache))
+    try:
+        with scheduler.slot("scan", pids=pids, cpus=workers):
+            yield from pool.imap_unordered(analyze, files)
+    finally:
+        pool.close()
+        pool.join()
+
+def collect_profiles(results, reports, trace=None):
+    """Pass results through, gathering their profiles into reports (moved to the trace file, if given)"""
+    for result in results:
+        if "profile" in result:
+            reports.append(result["profile"])
+            if trace is not None:
+                trace.write(json.dumps({"file": result.get("file"), "profile": result.pop("profile")}) + "\n")
+                trace.flush()
+        yield result
+
+def run_batch(files, workers=None, out=None, cache_db=None, streaming=None, dedupe=False, tier="full",
+              profile=False, trace=None, pcm_cache=None):
+    """Analyze files across a process pool, writing one JSON result per line as each finishes.
+
+    With profile, a last {"profile": ...} line summarizes the per-stage timings of all files.
+    """
+    out = out or sys.stdout
+    count = 0
+    reports = []
+    results = iter_results(files, workers, cache_db, streaming, dedupe, tier, profile, pcm_cache)
+    for result in collect_profiles(results, reports, trace):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        count += 1
+    if reports:
+        out.write(json.dumps({"profile": profiling.summarize(reports)}) + "\n")
+        out.flush()
+    return count
+
+def open_writer(db_path, pcm_cache=None):
+    """AnalysisWriter that records each row under the version of the tier that produced it"""
+    full_version, fast_version = analyzer_versions(pcm_cache)
+    return AnalysisWriter(full_version, db_path, fast_version=fast_version)
+
+def write_db(files, db_path, workers=None, cache_db=None, streaming=None, dedupe=False, tier="full",
+             profile=False, trace=None, pcm_cache=None):
+    """Analyze files and upsert the results into tracks/sample_analysis; returns a summary"""
+    writer = open_writer(db_path, pcm_cache)
+    reports = []
+    try:
+        results = iter_results(files, workers, cache_db, streaming, dedupe, tier, profile, pcm_cache)
+        for result in collect_profiles(results, reports, trace):
+            writer.add(result)
+    finally:
+        stats = writer.close()
+    summary = {"success": True, "db": db_path, **stats}
+    if reports:
+        summary["profile"] = profiling.summarize(reports)
+    return summary
+
+def run_job(jobs, job_id, workers=None, max_attempts=MAX_ATTEMPTS, cache_db=None, streaming=None,
+            dedupe=False, db_path=None, out=None, tier="full", profile=False, trace=None, pcm_cache=None):
+    """Analyze a scan job's remaining files, checkpointing each outcome in the job state.
+
+    Results go to db_path when given, otherwise to out as NDJSON. Failed files
+    are retried (in later passes) until they have failed max_attempts times.
+    A file is only marked done once its result has been written (and, for
+    db_path, committed), so a crash never leaves a done file without its row.
+    """
+    out = out or sys.stdout
+    writer = open_writer(db_path, pcm_cache) if db_path else None
+    if writer is not None:
+        jobs.before_checkpoint = writer.flush
+    reports = []
+    try:
+        files = jobs.remaining(job_id, max_attempts)
+        while files:
+            results = iter_results(files, workers, cache_db, streaming, dedupe, tier, profile, pcm_cache)
+            for result in collect_profiles(results, reports, trace):
+                if writer is not None:
+                    writer.add(result)
+                else:
+                    out.write(json.dumps(result) + "\n")
+                    out.flush()
+                jobs.record(job_id, result)
+            jobs.checkpoint()
+            files = jobs.remaining(job_id, max_attempts)
+    finally:
+        jobs.checkpoint()
+        jobs.before_checkpoint = None
+        stats = writer.close() if writer is not None else {}
+
+    jobs.finish(job_id, max_attempts)
+    summary = {"job": jobs.summary(job_id)}
+    if writer is not None:
+        summary.update(success=True, db=db_path, written=stats["written"])
+    if reports:
+        summary["profile"] = profiling.summarize(reports)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect tempo, key and mood of audio files")
+    parser.add_argument("files", nargs="?", help="JSON array of file paths (prints one JSON array)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Stream one JSON result per line (NDJSON) as each file finishes")
+    parser.add_argument("--files-from", default="-", metavar="PATH",
+                        help="File list for --batch, one path per line ('-' reads stdin)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for --batch (default: number of CPUs)")
+    parser.add_argument("--cache", nargs="?", const=DEFAULT_DB, default=None, metavar="DB",
+                        help=f"Reuse results for unchanged files from sample_analysis (default DB: {DEFAULT_DB})")
+    parser.add_argument("--streaming", choices=("auto", "on", "off"), default="auto",
+                        help="Block-wise analysis with bounded memory (auto: only for long files)")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Fingerprint files and reuse results of audibly identical copies (implies --cache)")
+    parser.add_argument("--db", nargs="?", const=DEFAULT_DB, default=None, metavar="DB",
+                        help="Write results into tracks/sample_analysis and print only a summary")
+    parser.add_argument("--pcm-cache", metavar="DIR",
+                        help="Keep decoded audio here as memory-mapped .npy files, so re-runs skip decoding")
+    parser.add_argument("--pcm-cache-max-gb", type=float, default=PCM_CACHE_MAX_BYTES / 1024 ** 3, metavar="GB",
+                        help="Evict the least recently used decoded audio past this size (default: %(default)g)")
+    parser.add_argument("--tier", choices=("full", "fast", "auto"), default="full",
+                        help="fast: low-rate excerpts with a confidence score; auto: fast, "
+                             f"re-analyzed in full below {FAST_CONFIDENCE_THRESHOLD} confidence "
+                             "(files too short for excerpts are always analyzed in full)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Attach per-stage wall/CPU time and RSS deltas to each result, plus a summary of all files")
+    parser.add_argument("--profile-trace", metavar="PATH",
+                        help="Write the per-file profiles to this NDJSON file instead (implies --profile)")
+    parser.add_argument("--job", action="store_true",
+                        help="Track the scan in a persistent job (printed at the end) so it can be resumed")
+    parser.add_argument("--resume", type=int, metavar="JOB_ID",
+                        help="Continue an interrupted job with its original options")
+    parser.add_argument("--job-status", type=int, metavar="JOB_ID", help="Print a job's progress")
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                        help="Give up on a failing file after this many attempts")
+    parser.add_argument("--jobs-db", default=DEFAULT_DB, metavar="DB", help="Where job state is kept")
+    args = parser.parse_args()
+
+    if args.job_status is not None or args.resume is not None or args.job:
+        jobs = ScanJobs(args.jobs_db)
+    else:
+        jobs = None
+
+    if args.job_status is not None:
+        try:
+            print(json.dumps(jobs.summary(args.job_status)))
+        except KeyError as e:
+            print(json.dumps({"error": e.args[0]}))
+        jobs.close()
+        return
+
+    if args.resume is not None:
+        try:
+            # The options the job was started with, so resumed results match
+            vars(args).update(jobs.options(args.resume))
+        except KeyError as e:
+            print(json.dumps({"error": e.args[0]}))
+            jobs.close()
+            return
+
+    if args.dedupe and not args.cache:
+        args.cache = DEFAULT_DB
+    streaming = {"auto": None, "on": True, "off": False}[args.streaming]
+    profile = args.profile or bool(args.profile_trace)
+    trace = open(args.profile_trace, "a") if args.profile_trace else None
+    try:
+        run_analysis(args, jobs, streaming, profile, trace)
+    finally:
+        if trace is not None:
+            trace.close()
+
+def run_analysis(args, jobs, streaming, profile, trace):
+    """The scan itself, once main() has resolved the options"""
+    pcm_cache = PCMCache(args.pcm_cache, int(args.pcm_cache_max_gb * 1024 ** 3)) if args.pcm_cache else None
+    if args.cache:
+        # Drop entries left behind by older analyzer code before the scan starts
+        cache = AnalysisCache(args.cache)
+        for version in analyzer_versions(pcm_cache):
+            cache.prune(version)
+        cache.close()
+
+    if jobs is not None:
+        if args.resume is not None:
+            job_id = args.resume
+        elif not args.batch and not args.files:
+            print(json.dumps({"error": "No files provided"}))
+            jobs.close()
+            return
+        else:
+            files = read_file_list(args.files_from) if args.batch else json.loads(args.files)
+            job_id = jobs.create(files, {name: getattr(args, name)
+                                         for name in ("cache", "dedupe", "db", "streaming", "tier",
+                                                      "pcm_cache", "pcm_cache_max_gb", "max_attempts")})
+        try:
+            summary = run_job(jobs, job_id, workers=args.workers, max_attempts=args.max_attempts,
+                              cache_db=args.cache, streaming=streaming, dedupe=args.dedupe,
+                              db_path=args.db, tier=args.tier, profile=profile, trace=trace,
+                              pcm_cache=pcm_cache)
+        finally:
+            jobs.close()
+        print(json.dumps(summary))
+        return
+
+    if args.batch and not args.db:
+        run_batch(read_file_list(args.files_from), workers=args.workers, cache_db=args.cache,
+                  streaming=streaming, dedupe=args.dedupe, tier=args.tier, profile=profile, trace=trace,
+                  pcm_cache=pcm_cache)
+        return
+
+    if not args.batch and not args.files:
+        print(json.dumps({"error": "No files provided"}))
+        return
+
+    if args.db:
+        files = read_file_list(args.files_from) if args.batch else json.loads(args.files)
+        print(json.dumps(write_db(files, args.db, workers=args.workers, cache_db=args.cache,
+                                  streaming=streaming, dedupe=args.dedupe, tier=args.tier,
+                                  profile=profile, trace=trace, pcm_cache=pcm_cache)))
+        return
+
+    files = json.loads(args.files)
+    init_cache(args.cache, args.dedupe, pcm_cache)
+    results = [analyze_cached(f, streaming=streaming, tier=args.tier, profile=profile) for f in files]
+    reports = []
+    results = list(collect_profiles(results, reports, trace))
+    if reports:
+        # Same last entry as the --batch NDJSON output
+        results.append({"profile": profiling.summarize(reports)})
     print(json.dumps(results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Music Assistant entry point
+One script for analyze, mix-match, train, generate and chat. Each subcommand
+imports its heavy dependencies (librosa, Magenta/TensorFlow, torch) only when
+it runs; --warm keeps one interpreter serving requests so they're paid once.
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+
+# Modules each subcommand imports on first use (what a cold start pays for)
+COMMAND_MODULES = {
+    "analyze": ("analyze_audio",),
+    "mix-match": ("mix_match",),
+    "train": ("midi_trainer",),
+    "generate": ("midi_ml_advanced", "midi_server"),
+    "chat": ("local_ai", "model_server"),
+}
+
+# Warm mode: one request per command at a time (the analyzers keep per-process state)
+_locks = {command: threading.Lock() for command in COMMAND_MODULES}
+
+# chat's in-process fallback model, loaded once per interpreter
+_chat_model = None
+
+def load(command):
+    """Import a subcommand's modules; returns the seconds it took"""
+    import importlib
+
+    start = time.time()
+    for name in COMMAND_MODULES[command]:
+        importlib.import_module(name)
+    return time.time() - start
+
+def analyze(request):
+    import analyze_audio
+    from pcm_cache import PCMCache
+
+    pcm_cache = PCMCache(request["pcmCache"]) if request.get("pcmCache") else None
+    analyze_audio.init_cache(request.get("cache"), request.get("dedupe", False), pcm_cache)
+    tier, profile = request.get("tier", "full"), request.get("profile", False)
+    return {"results": [analyze_audio.analyze_cached(path, tier=tier, profile=profile)
+                        for path in request["files"]]}
+
+def mix_match(request):
+    import mix_match
+
+    if "references" in request or "mixes" in request:
+        return mix_match.compare_batch(request.get("mixes") or [request["myPath"]],
+                                       request.get("references") or [request["refPath"]],
+                                       request.get("libraryDb", mix_match.DEFAULT_DB),
+                                       request.get("profile", False), request.get("pcmCache"))
+    return mix_match.compare(request["refPath"], request["myPath"], request.get("cacheDb"),
+                             request.get("profile", False), request.get("pcmCache"))
+
+def train(request):
+    """Learn the style of request["files"], or return the saved style when no files are given"""
+    from midi_trainer import MIDITrainer
+
+    trainer = MIDITrainer()
+    if not request.get("files"):
+        if not trainer.load_training_data():
+            return {"error": "No training data found. Please analyze your library first."}
+        return {"success": True, "user_style": trainer.user_style}
+
+    user_style = trainer.analyze_midi_library(request["files"])
+    if not user_style:
+        return {"error": "Failed to analyze library"}
+    trainer.save_training_data()
+    return {"success": True, "user_style": user_style, "message": "Library analyzed and style learned"}
+
+def generate(request):
+    import midi_server
+
+    job = {"kind": "variations", "count": request["variations"]} if request.get("variations") else {}
+    if request.get("profile"):
+        job["profile"] = True
+    try:
+        result = midi_server.generate(request["prompt"], **job)
+    except (RuntimeError, OSError) as e:
+        print(f"⚠️ MIDI server unavailable ({e}), loading models in-process", file=sys.stderr)
+        from midi_ml_advanced import MIDIMLGenerator
+        import profiling
+
+        with profiling.profiled(job.get("profile", False)) as recorded:
+            result = MIDIMLGenerator().run_job(dict(job, prompt=request["prompt"]))
+        if recorded is not None:
+            result["profile"] = recorded.report()
+    result.pop("done", None)
+    return result
+
+def chat(request):
+    global _chat_model
+    import model_server
+    import profiling
+
+    params = {"cache": True} if request.get("cache") else {}
+    if request.get("profile"):
+        params["profile"] = True
+    profile = None
+    try:
+        reply = model_server.generate(request["prompt"], **params)
+        response = reply.get("response", reply.get("error"))
+        profile = reply.get("profile")
+    except (RuntimeError, OSError) as e:
+        print(f"⚠️ Model server unavailable ({e}), loading model in-process", file=sys.stderr)
+        from local_ai import load_model, generate_response
+
+        with profiling.profiled(params.get("profile", False)) as recorded:
+            if _chat_model is None:
+                model, tokenizer = load_model()
+                if model is None or tokenizer is None:
+                    return {"error": "Failed to load model"}
+                _chat_model = (model, tokenizer)
+            response = generate_response(request["prompt"], *_chat_model)
+        if recorded is not None:
+            profile = recorded.report()
+
+    result = {"response": response, "model": "gemma-2-2b", "local": True}
+    if profile is not None:
+        result["profile"] = profile
+    return result
+
+HANDLERS = {
+    "analyze": analyze,
+    "mix-match": mix_match,
+    "train": train,
+    "generate": generate,
+    "chat": chat,
+}
+
+def dispatch(request):
+    """Run one {"command": ..., ...} request and return its reply"""
+    command = request.get("command")
+    if command not in HANDLERS:
+        return {"error": f"Unknown command: {command}"}
+    with _locks[command]:
+        return HANDLERS[command](request)
+
+def serve(socket_path=None):
+    """--warm: answer JSON-line requests until stdin closes (or forever on a socket)"""
+    import json_ipc
+
+    started = time.time()
+    served = {"requests": 0}
+
+    def handler(request):
+        if request.get("command") == "ping":
+            yield {"ok": True}
+            return
+        if request.get("command") == "stats":
+            yield {
+                "uptime_seconds": round(time.time() - started, 1),
+                "requests": served["requests"],
+                "loaded": [command for command, modules in COMMAND_MODULES.items()
+                           if all(name in sys.modules for name in modules)]
+            }
+            return
+        served["requests"] += 1
+        yield dispatch(request)
+
+    if socket_path:
+        json_ipc.serve_socket(socket_path, handler)
+    else:
+        json_ipc.serve_stdio(handler)
+
+def parse_request(args):
+    """Request dict for a one-shot subcommand's CLI arguments"""
+    return dict(_parse_command(args), profile=args.profile)
+
+def _parse_command(args):
+    if args.command == "analyze":
+        return {"command": "analyze", "files": json.loads(args.files), "tier": args.tier, "cache": args.cache,
+                "pcmCache": args.pcm_cache}
+    if args.command == "mix-match":
+        return dict(json.loads(args.args), command="mix-match")
+    if args.command == "train":
+        return {"command": "train", "files": json.loads(args.files) if args.files else []}
+    if args.command == "generate":
+        return {"command": "generate", "prompt": args.prompt, "variations": args.variations}
+    return {"command": "chat", "prompt": args.prompt, "cache": args.cache}
+
+def main():
+    parser = argparse.ArgumentParser(description="Music Assistant: analysis, MIDI and chat in one entry point")
+    parser.add_argument("--warm", action="store_true",
+                        help='Stay resident and serve {"command": ...} JSON lines on stdin/stdout')
+    parser.add_argument("--socket", metavar="PATH", help="With --warm, serve on this Unix socket instead")
+    parser.add_argument("--profile", action="store_true",
+                        help="Attach per-stage wall/CPU time and RSS deltas to the reply")
+    parser.add_argument("--load-only", action="store_true",
+                        help="Only import the subcommand's modules and print how long that took")
+    commands = parser.add_subparsers(dest="command")
+
+    analyze_parser = commands.add_parser("analyze", help="Tempo, key and mood of audio files")
+    analyze_parser.add_argument("files", nargs="?", default="[]", help="JSON array of file paths")
+    analyze_parser.add_argument("--tier", choices=("full", "fast", "auto"), default="full")
+    analyze_parser.add_argument("--cache", metavar="DB", help="Reuse results for unchanged files")
+    analyze_parser.add_argument("--pcm-cache", metavar="DIR", help="Reuse decoded audio across runs")
+
+    mix_parser = commands.add_parser("mix-match", help="Compare a mix against a reference")
+    mix_parser.add_argument("args", nargs="?", default="{}",
+                            help='JSON {"refPath", "myPath", "cacheDb", "pcmCache"}, or '
+                                 '{"mixes", "references", "libraryDb"} to compare many at once')
+
+    train_parser = commands.add_parser("train", help="Learn (or, without files, load) the MIDI library style")
+    train_parser.add_argument("files", nargs="?", help="JSON array of MIDI file paths")
+
+    generate_parser = commands.add_parser("generate", help="Generate MIDI from a prompt")
+    generate_parser.add_argument("prompt", nargs="?", default="")
+    generate_parser.add_argument("--variations", type=int, metavar="N", help="N candidates in one batch")
+
+    chat_parser = commands.add_parser("chat", help="Ask the local Gemma model")
+    chat_parser.add_argument("prompt", nargs="?", default="")
+    chat_parser.add_argument("--cache", action="store_true", help="Also cache this sampled reply")
+
+    args = parser.parse_args()
+
+    if args.warm:
+        serve(args.socket)
+        return
+
+    if args.command is None:
+        print(json.dumps({"error": "No command provided"}))
+        return
+
+    if args.load_only:
+        try:
+            print(json.dumps({"command": args.command, "load_seconds": round(load(args.command), 3)}))
+        except ImportError as e:
+            print(json.dumps({"command": args.command, "error": str(e)}))
+        return
+
+    try:
+        print(json.dumps(dispatch(parse_request(args))))
+    except Exception as e:
+        print(json.dumps({"error": str(e)}))
+
+if __name__ == "__main__":
+    main()
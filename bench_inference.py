@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Inference Benchmark for Music Assistant
+Tokens/sec and peak RSS of the local Gemma model in each inference mode.
+Each mode runs in its own process so peak RSS isn't shared between modes.
+"""
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+from bench_utils import peak_rss_mb
+
+DEFAULT_PROMPT = "Give me a trap chord progression idea in C minor."
+
+def run_mode(mode, prompt, max_new_tokens, threads, runs):
+    """Load the model in one mode and time greedy generations (runs in the child process)"""
+    import torch
+    from local_ai import load_model
+
+    start = time.time()
+    model, tokenizer = load_model(mode=mode, threads=threads)
+    if model is None:
+        return {"mode": mode, "error": "Failed to load model"}
+    load_seconds = time.time() - start
+
+    inputs = tokenizer(prompt, return_tensors="pt")
+    device = next(model.parameters()).device
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    prompt_length = inputs["input_ids"].shape[1]
+
+    def generate():
+        with torch.no_grad():
+            outputs = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                     pad_token_id=tokenizer.eos_token_id)
+        return outputs.shape[1] - prompt_length
+
+    # Warm-up pass so one-time allocations and the KV cache setup aren't timed
+    generate()
+
+    tokens = 0
+    start = time.time()
+    for _ in range(runs):
+        tokens += generate()
+    seconds = time.time() - start
+
+    return {
+        "mode": mode,
+        "device": str(device),
+        "threads": torch.get_num_threads(),
+        "load_seconds": round(load_seconds, 2),
+        "tokens": tokens,
+        "tokens_per_sec": round(tokens / seconds, 2) if seconds else 0,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local Gemma inference modes")
+    parser.add_argument("--modes", default="fp32,int8", help="Comma-separated inference modes")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", metavar="MODE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Keep stdout clean for the JSON line the parent reads
+        out, sys.stdout = sys.stdout, sys.stderr
+        result = run_mode(args.child, args.prompt, args.max_new_tokens, args.threads, args.runs)
+        out.write(json.dumps(result) + "\n")
+        return
+
+    results = []
+    for mode in args.modes.split(","):
+        command = [sys.executable, __file__, "--child", mode, "--prompt", args.prompt,
+                   "--max-new-tokens", str(args.max_new_tokens), "--runs", str(args.runs)]
+        if args.threads:
+            command += ["--threads", str(args.threads)]
+        proc = subprocess.run(command, capture_output=True, text=True)
+        lines = proc.stdout.strip().splitlines()
+        if proc.returncode != 0 or not lines:
+            error = (proc.stderr.strip().splitlines() or ["no output"])[-1]
+            results.append({"mode": mode, "error": error})
+        else:
+            results.append(json.loads(lines[-1]))
+
+    print(json.dumps({"benchmark": "inference", "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark for Music Assistant
+Cold-start time of each assist.py subcommand (a fresh interpreter importing
+what that subcommand needs), against importing the standalone script, and the
+per-request overhead of a --warm interpreter
+"""
+
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from assist import COMMAND_MODULES
+
+# The standalone script each subcommand replaces
+LEGACY_SCRIPTS = {
+    "analyze": "analyze_audio",
+    "mix-match": "mix_match",
+    "train": "midi_trainer",
+    "generate": "midi_ml_advanced",
+    "chat": "local_ai",
+}
+
+def wall_time(argv):
+    """Seconds a fresh process takes to run argv, or None when it fails"""
+    start = time.time()
+    completed = subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    seconds = time.time() - start
+    if completed.returncode != 0 or '"error"' in completed.stdout:
+        return None
+    return seconds
+
+def median_time(argv, runs):
+    times = [wall_time(argv) for _ in range(runs)]
+    if None in times:
+        return None
+    return round(statistics.median(times), 3)
+
+def warm_overhead(requests):
+    """Median round trip of a ping through a resident --warm interpreter, in ms"""
+    server = subprocess.Popen([sys.executable, "assist.py", "--warm"], stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        times = []
+        for _ in range(requests):
+            start = time.time()
+            server.stdin.write(json.dumps({"command": "ping"}) + "\n")
+            server.stdin.flush()
+            server.stdout.readline()
+            times.append(time.time() - start)
+        return round(statistics.median(times) * 1000, 2)
+    finally:
+        server.stdin.close()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold start of each assist.py subcommand")
+    parser.add_argument("--commands", default=",".join(COMMAND_MODULES),
+                        help="Comma-separated subcommands")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement")
+    args = parser.parse_args()
+
+    results = []
+    for command in args.commands.split(","):
+        cold = median_time([sys.executable, "assist.py", "--load-only", command], args.runs)
+        legacy = median_time([sys.executable, "-c", f"import {LEGACY_SCRIPTS[command]}"], args.runs)
+        result = {"command": command, "cold_start_seconds": cold, "legacy_import_seconds": legacy}
+        if cold is None:
+            result["error"] = "Dependencies not available"
+        results.append(result)
+
+    print(json.dumps({
+        "benchmark": "startup",
+        "runs": args.runs,
+        "interpreter_seconds": median_time([sys.executable, "-c", "pass"], args.runs),
+        "dispatcher_seconds": median_time([sys.executable, "-c", "import assist"], args.runs),
+        "warm_request_ms": warm_overhead(args.runs * 10),
+        "results": results
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
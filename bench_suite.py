@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for Music Assistant
+Offline speed and accuracy of the analyzers, the MIDI trainer and the
+generators on deterministic synthetic fixtures: click-track WAVs of known
+tempo and key, and MIDI libraries of known keys. Each target runs in its own
+process so peak RSS isn't shared between targets.
+"""
+
+import os
+import sys
+import json
+import time
+import wave
+import struct
+import tempfile
+import argparse
+import subprocess
+import numpy as np
+from bench_utils import peak_rss_mb
+from key_detection import PITCH_CLASSES
+
+TARGETS = ("analyze", "analyze-fast", "mix-match", "train", "generate")
+
+DEFAULT_FIXTURES = os.path.join(tempfile.gettempdir(), "music_assistant_bench")
+
+# (tempo, key) of the synthetic tracks, cycled through for each length and sample rate
+TRACK_CASES = [(90, "A minor"), (120, "C major"), (140, "F# minor"), (100, "D# major"),
+               (128, "G major"), (75, "E minor")]
+
+# Keys of the MIDI library files, cycled through; A minor is the most common
+MIDI_KEYS = ["A minor", "C major", "A minor", "E minor", "F major", "A minor", "D major"]
+
+SCALES = {"major": [0, 2, 4, 5, 7, 9, 11], "minor": [0, 2, 3, 5, 7, 8, 10]}
+
+# Melody scale-degree weights: tonic, third and fifth come up most
+DEGREE_WEIGHTS = np.array([4, 1, 3, 1, 3, 1, 1], dtype=np.float64)
+
+def parse_key(key):
+    tonic, mode = key.split()
+    return PITCH_CLASSES.index(tonic), mode
+
+def midi_to_hz(pitch):
+    return 440.0 * 2 ** ((pitch - 69) / 12)
+
+def tone(pitch, length, sr, harmonics=3):
+    t = np.arange(length) / sr
+    return sum(np.sin(2 * np.pi * midi_to_hz(pitch) * h * t) / h for h in range(1, harmonics + 1))
+
+def synth_track(tempo, key, seconds, sr, seed):
+    """Click track at tempo over a held tonic triad and a scale melody, one note per beat"""
+    rng = np.random.default_rng(seed)
+    tonic, mode = parse_key(key)
+    scale = SCALES[mode]
+    samples = int(seconds * sr)
+    beat = 60.0 / tempo
+    y = np.zeros(samples)
+
+    # Held triad in two octaves
+    for pitch in (48 + tonic, 48 + tonic + scale[2], 48 + tonic + 7, 60 + tonic):
+        y += 0.06 * tone(pitch, samples, sr)
+
+    # One melody note and one click per beat; downbeats accented
+    note_length = int(beat * sr)
+    envelope = np.exp(-np.arange(note_length) / (0.3 * note_length))
+    click_length = int(0.03 * sr)
+    click = (np.sin(2 * np.pi * 1500 * np.arange(click_length) / sr)
+             + 0.5 * rng.standard_normal(click_length)) * np.exp(-np.arange(click_length) / (0.005 * sr))
+    for index, start in enumerate(np.arange(0, seconds, beat)):
+        i = int(start * sr)
+        degree = rng.choice(7, p=DEGREE_WEIGHTS / DEGREE_WEIGHTS.sum())
+        note = (0.15 * tone(72 + tonic + scale[degree], note_length, sr) * envelope)[:samples - i]
+        y[i:i + len(note)] += note
+        segment = click[:samples - i] * (0.6 if index % 4 == 0 else 0.35)
+        y[i:i + len(segment)] += segment
+
+    return 0.8 * y / np.abs(y).max()
+
+def write_wav(path, y, sr):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes((np.clip(y, -1, 1) * 32767).astype("<i2").tobytes())
+
+def _varlen(value):
+    data = [value & 0x7F]
+    value >>= 7
+    while value:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(data))
+
+def write_midi(path, notes, tempo, key, ticks_per_beat=480):
+    """Format-0 Standard MIDI File; notes are (pitch, start_beat, beats, velocity)"""
+    tonic, mode = parse_key(key)
+    # Key signature: sharps (+) or flats (-) of the relative major
+    major_tonic = tonic if mode == "major" else (tonic + 3) % 12
+    sharps = (major_tonic * 7 + 6) % 12 - 6
+
+    events = [(0, 0, b"\xff\x51\x03" + int(60e6 / tempo).to_bytes(3, "big")),
+              (0, 0, b"\xff\x59\x02" + struct.pack("bB", sharps, mode == "minor"))]
+    for pitch, start, beats, velocity in notes:
+        events.append((round(start * ticks_per_beat), 2, bytes([0x90, pitch, velocity])))
+        events.append((round((start + beats) * ticks_per_beat), 1, bytes([0x80, pitch, 0])))
+    events.sort(key=lambda event: event[:2])
+
+    track, last = b"", 0
+    for tick, _, data in events:
+        track += _varlen(tick - last) + data
+        last = tick
+    track += b"\x00\xff\x2f\x00"
+
+    with open(path, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, ticks_per_beat))
+        f.write(b"MTrk" + struct.pack(">I", len(track)) + track)
+
+def synth_midi(key, bars, seed):
+    """Tonic-triad chords on each bar plus a scale melody in eighth notes"""
+    rng = np.random.default_rng(seed)
+    tonic, mode = parse_key(key)
+    scale = SCALES[mode]
+    notes = []
+    for bar in range(bars):
+        for offset in (0, scale[2], 7):
+            notes.append((48 + tonic + offset, bar * 4, 4, 70))
+        for step in range(8):
+            degree = rng.choice(7, p=DEGREE_WEIGHTS / DEGREE_WEIGHTS.sum())
+            notes.append((60 + tonic + scale[degree], bar * 4 + step / 2, 0.5, 90))
+    return notes
+
+def make_fixtures(directory, lengths, rates, tracks, midi_files, bars):
+    """Write the fixtures (reused when the same settings were written before); returns the manifest"""
+    settings = {"lengths": lengths, "rates": rates, "tracks": tracks, "midi_files": midi_files, "bars": bars}
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest["settings"] == settings:
+            return manifest
+
+    os.makedirs(os.path.join(directory, "midi"), exist_ok=True)
+    audio, midi = [], []
+    seed = 0
+    for seconds in lengths:
+        for sr in rates:
+            for index in range(tracks):
+                tempo, key = TRACK_CASES[index % len(TRACK_CASES)]
+                path = os.path.join(directory, f"track_{seconds:g}s_{sr}_{tempo}bpm_{key.replace(' ', '_')}.wav")
+                write_wav(path, synth_track(tempo, key, seconds, sr, seed), sr)
+                audio.append({"file": path, "tempo": tempo, "key": key, "seconds": seconds, "sr": sr})
+                seed += 1
+
+    for index in range(midi_files):
+        key = MIDI_KEYS[index % len(MIDI_KEYS)]
+        tempo = 80 + (index * 7) % 80
+        path = os.path.join(directory, "midi", f"song_{index:04d}.mid")
+        write_midi(path, synth_midi(key, bars, index), tempo, key)
+        midi.append({"file": path, "tempo": tempo, "key": key})
+
+    manifest = {"settings": settings, "audio": audio, "midi": midi}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def share(values):
+    return round(sum(values) / len(values), 3) if values else None
+
+def bench_analyzer(manifest, analyze):
+    from feature_extractor import tempo_agrees
+
+    # Untimed first call, so one-time JIT compilation inside librosa isn't counted
+    analyze(manifest["audio"][0]["file"])
+    start = time.time()
+    results = [analyze(item["file"]) for item in manifest["audio"]]
+    seconds = time.time() - start
+    ok = [(item, result) for item, result in zip(manifest["audio"], results) if "error" not in result]
+    return {
+        "files": len(results),
+        "wall_seconds": round(seconds, 3),
+        "errors": len(results) - len(ok),
+        "accuracy": {
+            # Octave errors (double/half time) counted separately from exact tempo hits
+            "tempo": share([tempo_agrees(result["tempo"], item["tempo"], 0.02) for item, result in ok]),
+            "tempo_exact": share([abs(result["tempo"] - item["tempo"]) <= 0.02 * item["tempo"]
+                                  for item, result in ok]),
+            "key": share([result.get("key") == item["key"] for item, result in ok])
+        }
+    }
+
+def run_target(target, manifest, directory, generations):
+    """Time one target over the fixtures (runs in the child process)"""
+    if target == "analyze":
+        from analyze_audio import analyze_file
+        result = bench_analyzer(manifest, analyze_file)
+    elif target == "analyze-fast":
+        from functools import partial
+        from analyze_audio import analyze_tier
+        result = bench_analyzer(manifest, partial(analyze_tier, tier="fast"))
+    elif target == "mix-match":
+        from mix_match import analyze
+        analyze(manifest["audio"][0]["file"])
+        start = time.time()
+        for item in manifest["audio"]:
+            analyze(item["file"])
+        result = {"files": len(manifest["audio"]), "wall_seconds": round(time.time() - start, 3)}
+    elif target == "train":
+        result = bench_trainer(manifest, directory)
+    else:
+        result = bench_generator(directory, generations)
+
+    if result.get("files") and result.get("wall_seconds"):
+        result["files_per_sec"] = round(result["files"] / result["wall_seconds"], 2)
+    return {"target": target, **result, "peak_rss_mb": peak_rss_mb()}
+
+def bench_trainer(manifest, directory):
+    import note_store
+    from midi_trainer import MIDITrainer
+    from key_detection import estimate_keys
+
+    files = [item["file"] for item in manifest["midi"]]
+    store_path = os.path.join(directory, "midi_notes")
+    for suffix in (".npy", ".json"):
+        if os.path.exists(store_path + suffix):
+            os.remove(store_path + suffix)
+
+    trainer = MIDITrainer()
+    start = time.time()
+    style = trainer.analyze_midi_library(files, store_path=store_path)
+    seconds = time.time() - start
+    if not style or not style.get("files_analyzed"):
+        return {"error": "Library analysis failed (are Magenta and note_seq installed?)"}
+
+    # Unchanged library: only the statistics are recomputed
+    start = time.time()
+    trainer.analyze_midi_library(files, store_path=store_path)
+    rerun_seconds = time.time() - start
+
+    # Per-file keys the way the trainer estimates them
+    store = note_store.NoteStore(store_path)
+    notes, tempos, _ = store.select(files)
+    histograms = note_store.pitch_class_histograms(notes, len(tempos))
+    detected = estimate_keys(histograms)
+    ids = [store.index["files"][item["file"]]["id"] for item in manifest["midi"]]
+    keys = [item["key"] for item in manifest["midi"]]
+
+    return {
+        "files": len(files),
+        "wall_seconds": round(seconds, 3),
+        "rerun_seconds": round(rerun_seconds, 3),
+        "accuracy": {
+            "key": share([detected[file_id]["key"] == key for file_id, key in zip(ids, keys)]),
+            "common_key": style["common_keys"][0] == max(set(keys), key=keys.count),
+            "avg_tempo_error": round(abs(style["avg_tempo"] - np.mean([item["tempo"] for item in manifest["midi"]])), 3)
+        }
+    }
+
+def bench_generator(directory, generations):
+    from midi_ml_advanced import MIDIMLGenerator
+
+    start = time.time()
+    generator = MIDIMLGenerator()
+    load_seconds = time.time() - start
+
+    start = time.time()
+    errors = 0
+    for index in range(generations):
+        result = generator.run_job({"prompt": "trap melody in A minor at 140 bpm", "cwd": directory,
+                                    "output": f"generated_{index}.mid"})
+        errors += "error" in result
+    if errors == generations:
+        return {"error": "Generation failed (are Magenta and its bundles installed?)"}
+    return {"files": generations, "load_seconds": round(load_seconds, 3),
+            "wall_seconds": round(time.time() - start, 3), "errors": errors}
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite on synthetic fixtures")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="Comma-separated targets")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, metavar="DIR", help="Where fixtures are written")
+    parser.add_argument("--lengths", default="10,30", help="Comma-separated track lengths in seconds")
+    parser.add_argument("--rates", default="22050,44100", help="Comma-separated sample rates")
+    parser.add_argument("--tracks", type=int, default=2, help="Tracks per length and sample rate")
+    parser.add_argument("--midi-files", type=int, default=100, help="Size of the MIDI library")
+    parser.add_argument("--bars", type=int, default=16, help="Bars per MIDI file")
+    parser.add_argument("--generations", type=int, default=3, help="Generator runs")
+    parser.add_argument("--baseline", metavar="PATH", help="Earlier report to compare wall times against")
+    parser.add_argument("--child", metavar="TARGET", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    manifest = make_fixtures(args.fixtures, [float(v) for v in args.lengths.split(",")],
+                             [int(v) for v in args.rates.split(",")], args.tracks, args.midi_files, args.bars)
+
+    if args.child:
+        # Keep stdout clean for the JSON line the parent reads
+        out, sys.stdout = sys.stdout, sys.stderr
+        try:
+            result = run_target(args.child, manifest, args.fixtures, args.generations)
+        except ImportError as e:
+            result = {"target": args.child, "error": str(e)}
+        out.write(json.dumps(result) + "\n")
+        return
+
+    results = []
+    for target in args.targets.split(","):
+        command = [sys.executable, __file__, "--child", target] + [
+            value for name in ("fixtures", "lengths", "rates", "tracks", "midi_files", "bars", "generations")
+            for value in (f"--{name.replace('_', '-')}", str(getattr(args, name)))
+        ]
+        proc = subprocess.run(command, capture_output=True, text=True)
+        lines = proc.stdout.strip().splitlines()
+        if proc.returncode != 0 or not lines:
+            error = (proc.stderr.strip().splitlines() or ["no output"])[-1]
+            results.append({"target": target, "error": error})
+        else:
+            results.append(json.loads(lines[-1]))
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = {result["target"]: result for result in json.load(f)["results"]}
+        for result in results:
+            before = baseline.get(result["target"], {}).get("wall_seconds")
+            if before and result.get("wall_seconds"):
+                result["speedup_vs_baseline"] = round(before / result["wall_seconds"], 2)
+
+    print(json.dumps({
+        "benchmark": "suite",
+        "fixtures": {"audio": len(manifest["audio"]), "midi": len(manifest["midi"]), **manifest["settings"]},
+        "results": results
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
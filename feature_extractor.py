@@ -0,0 +1,390 @@
+"""
+Feature Extractor for Music Assistant
+Decodes each audio file once and derives every descriptor from shared spectra
+"""
+
+from functools import cached_property
+import numpy as np
+import librosa
+from numpy.lib.stride_tricks import sliding_window_view
+from key_detection import estimate_key
+from profiling import stage, timed_iter
+
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# Streaming analysis: frames per block (~3 s at 44.1 kHz) and the onset
+# autocorrelation window, which matches librosa's tempogram default
+BLOCK_LENGTH = 256
+TEMPO_WIN_LENGTH = 384
+MAX_TEMPO = 320.0
+
+# CQT needs enough samples for its lowest octave; shorter tail blocks skip chroma
+CHROMA_MIN_FRAMES = 64
+
+# Files longer than this are analyzed block-wise by load_features
+STREAM_MIN_SECONDS = 600
+
+# Fast tier: EXCERPT_COUNT windows of EXCERPT_SECONDS at a low sample rate.
+# FAST_HOP_LENGTH keeps the onset frame rate of the full path on 44.1 kHz files
+# (~86 per second), which beat tracking needs for tempo resolution. Files no
+# longer than EXCERPT_COUNT * EXCERPT_SECONDS get the full analysis instead
+# (see use_excerpts): cut into fragments they cost more than analyzing them
+# whole (0.67-0.78x on 5-10 s clips). Longer ones only ever cost the excerpts;
+# bench_fast_tier measured 1.3x (22.05 kHz) to 3.1x (44.1 kHz) on 90 s files
+# and 2.3x to 5.1x on 150 s files.
+FAST_SAMPLE_RATE = 11025
+FAST_N_FFT = 1024
+FAST_HOP_LENGTH = 128
+EXCERPT_SECONDS = 20.0
+EXCERPT_COUNT = 3
+
+# Excerpt tempos agree when within this fraction of each other (or an octave apart)
+TEMPO_AGREEMENT = 0.04
+
+# MFCC summary length for similarity vectors
+N_MFCC = 13
+
+# Crude mood detection: energy vs. chill
+MOOD_RMS_THRESHOLD = 0.02
+
+# rms(S=...) measures the Hann-windowed frame; dividing by the window's RMS
+# brings it back in line with time-domain rms(y=...), so the threshold holds
+WINDOW_RMS = float(np.sqrt(np.mean(librosa.filters.get_window("hann", N_FFT, fftbins=True) ** 2)))
+
+def mood_from_rms(rms):
+    return "energetic" if rms > MOOD_RMS_THRESHOLD else "chill"
+
+def tempo_agrees(a, b, tolerance=TEMPO_AGREEMENT):
+    """Same tempo within tolerance, counting double/half time as the same"""
+    if a <= 0 or b <= 0:
+        return False
+    octaves = abs(np.log2(a / b))
+    return bool(min(octaves, abs(octaves - 1)) <= np.log2(1 + tolerance))
+
+class AudioFeatures:
+    """One decoded file; each spectrum is computed on first use and shared by all descriptors"""
+
+    def __init__(self, y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH):
+        self.y = y
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+
+    @classmethod
+    def from_file(cls, file_path, sr=None, pcm_cache=None):
+        """Decode the file at its native rate (or sr), or read it from pcm_cache (native rate up to its cap)"""
+        if pcm_cache is not None:
+            return cls(*pcm_cache.load(file_path))
+        with stage("load"):
+            y, sr = librosa.load(file_path, sr=sr)
+        return cls(y, sr)
+
+    # Shared intermediates. Each profiling stage resolves the intermediates it
+    # depends on before it opens, so stage times don't include one another.
+
+    @cached_property
+    def stft(self):
+        """STFT magnitude"""
+        with stage("stft"):
+            return np.abs(librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length))
+
+    @cached_property
+    def mel_db(self):
+        """Log-power mel spectrogram, built from the STFT magnitude"""
+        S = self.stft
+        with stage("mel"):
+            return librosa.power_to_db(librosa.feature.melspectrogram(S=S ** 2, sr=self.sr))
+
+    @cached_property
+    def onset_envelope(self):
+        mel_db = self.mel_db
+        with stage("onset"):
+            return librosa.onset.onset_strength(S=mel_db, sr=self.sr, hop_length=self.hop_length)
+
+    @cached_property
+    def chroma(self):
+        """CQT chroma"""
+        with stage("chroma_cqt"):
+            return librosa.feature.chroma_cqt(y=self.y, sr=self.sr, hop_length=self.hop_length)
+
+    @cached_property
+    def mfcc(self):
+        mel_db = self.mel_db
+        with stage("mfcc"):
+            return librosa.feature.mfcc(S=mel_db, n_mfcc=N_MFCC)
+
+    @cached_property
+    def rms_frames(self):
+        S = self.stft
+        with stage("spectral"):
+            return librosa.feature.rms(S=S, frame_length=self.n_fft, hop_length=self.hop_length)[0] / WINDOW_RMS
+
+    # Descriptors
+
+    def tempo(self):
+        onset_envelope = self.onset_envelope
+        with stage("beat_track"):
+            tempo, _ = librosa.beat.beat_track(onset_envelope=onset_envelope,
+                                               sr=self.sr, hop_length=self.hop_length)
+        return float(np.atleast_1d(tempo)[0])
+
+    def key(self):
+        """{"key", "tonic", "mode", "confidence"} from the mean chroma"""
+        chroma_mean = self.chroma_mean()
+        with stage("key"):
+            return estimate_key(chroma_mean)
+
+    def key_index(self):
+        return self.key()["tonic"]
+
+    def chroma_mean(self):
+        return self.chroma.mean(axis=1)
+
+    def mfcc_mean(self):
+        return self.mfcc.mean(axis=1)
+
+    def rms(self):
+        return float(self.rms_frames.mean())
+
+    def mood(self):
+        return mood_from_rms(self.rms())
+
+    def centroid(self):
+        S = self.stft
+        with stage("spectral"):
+            return float(librosa.feature.spectral_centroid(S=S, sr=self.sr).mean())
+
+    def bandwidth(self):
+        S = self.stft
+        with stage("spectral"):
+            return float(librosa.feature.spectral_bandwidth(S=S, sr=self.sr).mean())
+
+class StreamingFeatures:
+    """Block-wise analysis with memory bounded by the block size, not the file length.
+
+    Reads BLOCK_LENGTH frames at a time and accumulates running sums of frame
+    RMS, centroid, bandwidth, MFCCs and CQT chroma, plus the onset envelope's
+    autocorrelation over TEMPO_WIN_LENGTH lags. Only the last TEMPO_WIN_LENGTH
+    onset values and one mel frame are carried between blocks.
+
+    Tolerance against AudioFeatures on the same file: RMS, centroid and
+    bandwidth within 1% (frames are not centre-padded and the dB floor is per
+    block); the MFCC mean vector within about 4% (relative L2, up to ~3.6%
+    seen), most of it in the 0th (loudness) coefficient, since it comes from
+    the same per-block dB mel frames; key identical for tonal material, as block edges only
+    smear chroma slightly; tempo within 2%, or the same tempo an octave
+    apart, because a global onset autocorrelation stands in for the mean
+    local tempogram.
+    """
+
+    def __init__(self, sr):
+        self.sr = sr
+        self.frames = 0
+        self.chroma_frames = 0
+        self.rms_sum = 0.0
+        self.centroid_sum = 0.0
+        self.bandwidth_sum = 0.0
+        self.chroma_sum = np.zeros(12)
+        self.mfcc_sum = np.zeros(N_MFCC)
+        self.onset_autocorr = np.zeros(TEMPO_WIN_LENGTH)
+        self.onset_tail = np.zeros(TEMPO_WIN_LENGTH - 1)
+        self.last_mel_db = None
+
+    @classmethod
+    def from_file(cls, file_path, block_length=BLOCK_LENGTH, pcm_cache=None):
+        if pcm_cache is not None:
+            sr, blocks = pcm_cache.stream(file_path, block_length, N_FFT, HOP_LENGTH)
+        else:
+            sr = librosa.get_samplerate(file_path)
+            blocks = librosa.stream(file_path, block_length=block_length, frame_length=N_FFT,
+                                    hop_length=HOP_LENGTH, mono=True, fill_value=None)
+        features = cls(sr)
+        for y_block in timed_iter("load", blocks):
+            features.add_block(y_block)
+        return features
+
+    def add_block(self, y):
+        # The final block is short rather than zero-padded; skip it if it can't fill a frame
+        if len(y) < N_FFT:
+            return
+        with stage("stft"):
+            S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH, center=False))
+
+        self.frames += S.shape[1]
+        with stage("spectral"):
+            self.rms_sum += float((librosa.feature.rms(S=S, frame_length=N_FFT)[0] / WINDOW_RMS).sum())
+            self.centroid_sum += float(librosa.feature.spectral_centroid(S=S, sr=self.sr).sum())
+            self.bandwidth_sum += float(librosa.feature.spectral_bandwidth(S=S, sr=self.sr).sum())
+
+        if S.shape[1] >= CHROMA_MIN_FRAMES:
+            with stage("chroma_cqt"):
+                chroma = librosa.feature.chroma_cqt(y=y, sr=self.sr, hop_length=HOP_LENGTH)
+            self.chroma_sum += chroma.sum(axis=1)
+            self.chroma_frames += chroma.shape[1]
+
+        # Onset strength: mean positive mel flux, continued across the block edge
+        with stage("mel"):
+            mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=S ** 2, sr=self.sr))
+        with stage("onset"):
+            previous = mel_db[:, :1] if self.last_mel_db is None else self.last_mel_db
+            onset = np.maximum(0.0, np.diff(np.hstack([previous, mel_db]), axis=1)).mean(axis=0)
+            self.last_mel_db = mel_db[:, -1:]
+        with stage("mfcc"):
+            self.mfcc_sum += librosa.feature.mfcc(S=mel_db, n_mfcc=N_MFCC).sum(axis=1)
+
+        # autocorr[lag] += sum over the new frames t of onset[t] * onset[t - lag]
+        with stage("beat_track"):
+            history = np.concatenate([self.onset_tail, onset])
+            windows = sliding_window_view(history, TEMPO_WIN_LENGTH)[-len(onset):]
+            self.onset_autocorr += windows[:, ::-1].T @ onset
+            self.onset_tail = history[-(TEMPO_WIN_LENGTH - 1):]
+
+    # Descriptors
+
+    def tempo(self):
+        """librosa.feature.tempo's log-normal prior around 120 BPM, on the accumulated autocorrelation"""
+        if self.onset_autocorr[0] <= 0:
+            return 0.0
+        bpms = librosa.tempo_frequencies(TEMPO_WIN_LENGTH, hop_length=HOP_LENGTH, sr=self.sr)
+        autocorr = self.onset_autocorr / self.onset_autocorr[0]
+        with np.errstate(divide="ignore"):
+            logprior = -0.5 * ((np.log2(bpms) - np.log2(120.0)) / 1.0) ** 2
+        logprior[bpms > MAX_TEMPO] = -np.inf
+        return float(bpms[np.argmax(np.log1p(1e6 * autocorr) + logprior)])
+
+    def key(self):
+        """{"key", "tonic", "mode", "confidence"} from the mean chroma"""
+        chroma_mean = self.chroma_mean()
+        with stage("key"):
+            return estimate_key(chroma_mean)
+
+    def key_index(self):
+        return self.key()["tonic"]
+
+    def chroma_mean(self):
+        return self.chroma_sum / max(self.chroma_frames, 1)
+
+    def mfcc_mean(self):
+        return self.mfcc_sum / max(self.frames, 1)
+
+    def rms(self):
+        return self.rms_sum / max(self.frames, 1)
+
+    def mood(self):
+        return mood_from_rms(self.rms())
+
+    def centroid(self):
+        return self.centroid_sum / max(self.frames, 1)
+
+    def bandwidth(self):
+        return self.bandwidth_sum / max(self.frames, 1)
+
+def use_excerpts(file_path):
+    """Whether the fast tier samples this file; shorter (or unreadable) files go to the full analysis"""
+    try:
+        return excerpt_offsets(librosa.get_duration(path=file_path)) is not None
+    except Exception:
+        return False
+
+def excerpt_offsets(duration):
+    """Start times of EXCERPT_COUNT evenly spaced excerpts, or None when the file is too short to sample"""
+    if duration <= EXCERPT_COUNT * EXCERPT_SECONDS:
+        return None
+    return [duration * (index + 1) / (EXCERPT_COUNT + 1) - EXCERPT_SECONDS / 2 for index in range(EXCERPT_COUNT)]
+
+class ExcerptFeatures:
+    """Fast tier: a few excerpts decoded at FAST_SAMPLE_RATE instead of the whole file.
+
+    Files longer than EXCERPT_COUNT excerpts are sampled at evenly spaced
+    points; shorter ones are split into EXCERPT_COUNT parts. confidence() is
+    how well the excerpts agree on tempo and key.
+    """
+
+    def __init__(self, excerpts, sr=FAST_SAMPLE_RATE):
+        self.excerpts = [AudioFeatures(y, sr, n_fft=FAST_N_FFT, hop_length=FAST_HOP_LENGTH)
+                         for y in excerpts]
+
+    @classmethod
+    def from_file(cls, file_path, pcm_cache=None):
+        """Decode just the excerpts, or cut them from pcm_cache when it already holds the file"""
+        audio = pcm_cache.lookup(file_path) if pcm_cache is not None else None
+        if audio is not None:
+            return cls.from_pcm(*audio)
+
+        with stage("load"):
+            offsets = excerpt_offsets(librosa.get_duration(path=file_path))
+            if offsets is None:
+                y, _ = librosa.load(file_path, sr=FAST_SAMPLE_RATE)
+                return cls(np.array_split(y, EXCERPT_COUNT))
+
+            excerpts = [librosa.load(file_path, sr=FAST_SAMPLE_RATE, offset=offset, duration=EXCERPT_SECONDS)[0]
+                        for offset in offsets]
+        return cls(excerpts)
+
+    @classmethod
+    def from_pcm(cls, y, sr):
+        """The same excerpts cut from already decoded audio and resampled to FAST_SAMPLE_RATE"""
+        with stage("resample"):
+            offsets = excerpt_offsets(len(y) / sr)
+            if offsets is None:
+                y = librosa.resample(np.asarray(y), orig_sr=sr, target_sr=FAST_SAMPLE_RATE)
+                return cls(np.array_split(y, EXCERPT_COUNT))
+
+            length = int(EXCERPT_SECONDS * sr)
+            excerpts = [librosa.resample(np.asarray(y[int(offset * sr):int(offset * sr) + length]),
+                                         orig_sr=sr, target_sr=FAST_SAMPLE_RATE)
+                        for offset in offsets]
+        return cls(excerpts)
+
+    @cached_property
+    def tempos(self):
+        return [excerpt.tempo() for excerpt in self.excerpts]
+
+    @cached_property
+    def keys(self):
+        return [excerpt.key()["key"] for excerpt in self.excerpts]
+
+    # Descriptors
+
+    def tempo(self):
+        return float(np.median(self.tempos))
+
+    def key(self):
+        return estimate_key(sum(excerpt.chroma_mean() for excerpt in self.excerpts))
+
+    def key_index(self):
+        return self.key()["tonic"]
+
+    def rms(self):
+        return float(np.mean([excerpt.rms() for excerpt in self.excerpts]))
+
+    def mood(self):
+        return mood_from_rms(self.rms())
+
+    def confidence(self):
+        """Mean of the shares of excerpts agreeing with the overall tempo and key"""
+        tempo, key = self.tempo(), self.key()["key"]
+        tempo_share = np.mean([tempo_agrees(t, tempo) for t in self.tempos])
+        key_share = np.mean([k == key for k in self.keys])
+        return float((tempo_share + key_share) / 2)
+
+def should_stream(file_path, streaming=None):
+    """streaming, or when None whether the file is longer than STREAM_MIN_SECONDS (False if unreadable)"""
+    if streaming is not None:
+        return streaming
+    try:
+        return librosa.get_duration(path=file_path) > STREAM_MIN_SECONDS
+    except Exception:
+        return False
+
+def load_features(file_path, streaming=None, pcm_cache=None):
+    """AudioFeatures for the file, or StreamingFeatures when streaming is set.
+
+    streaming=None picks the streaming path for files longer than
+    STREAM_MIN_SECONDS, and a whole-file decode when the length can't be read.
+    With a PCMCache the audio is read from (and added to) the cache.
+    """
+    if should_stream(file_path, streaming):
+        return StreamingFeatures.from_file(file_path, pcm_cache=pcm_cache)
+    return AudioFeatures.from_file(file_path, pcm_cache=pcm_cache)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Audio Fingerprints for Music Assistant
+Spectral-peak landmark fingerprints summarized as MinHash signatures, so
+re-encoded or re-tagged copies of a sample land in the same LSH buckets
+"""
+
+import json
+import argparse
+from multiprocessing import Pool
+import numpy as np
+
+# Decode rate and spectrogram for peak picking (peaks above ~5 kHz add little)
+SAMPLE_RATE = 11025
+N_FFT = 1024
+HOP_LENGTH = 256
+
+# A peak is the maximum of its (frequency bins, frames) neighbourhood and
+# within PEAK_RANGE_DB of the loudest bin in the file
+PEAK_NEIGHBOURHOOD = (15, 11)
+PEAK_RANGE_DB = 50.0
+
+# Only the strongest peaks of each second are kept, so the noise floor
+# (which differs between copies) doesn't swamp the landmarks
+PEAKS_PER_SECOND = 20
+
+# Peaks of a shifted or re-encoded copy land a bin or frame off about half
+# the time, so landmarks use a coarser grid (4 bins ~ 43 Hz, 4 frames ~ 93 ms)
+FREQ_QUANT = 4
+TIME_QUANT = 4
+
+# Each peak is paired with the next FAN_OUT peaks up to MAX_DT grid steps later
+FAN_OUT = 5
+MAX_DT = 15
+
+# Landmarks hashed per step, to bound the (NUM_HASHES x chunk) temporary
+MINHASH_CHUNK = 1 << 16
+
+# MinHash signature length, split into LSH bands of BAND_ROWS values
+NUM_HASHES = 128
+BAND_ROWS = 2
+NUM_BANDS = NUM_HASHES // BAND_ROWS
+
+# Share of equal MinHash values (estimated landmark Jaccard). Bit-identical
+# copies score 1.0; gain-changed copies 0.84-1.0 and resampled ones 0.81-1.0,
+# lowest on short, sparse clips where equally loud peaks tie and a rounding
+# difference picks another one (test_fingerprint.py keeps a 0.1 margin on
+# dense material). A copy trimmed to 80% scores ~0.78-0.9, MP3/OGG re-encodes
+# and added noise ~0.2-0.6. Different material in another key scores up to
+# ~0.08, but in the same key and tempo it reaches ~0.4-0.6.
+# DUPLICATE_SIMILARITY only flags candidates for review (the CLI);
+# REUSE_SIMILARITY is the bar for copying a stored analysis onto a file.
+DUPLICATE_SIMILARITY = 0.1
+REUSE_SIMILARITY = 0.8
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0x5EED)
+_HASH_A = _rng.integers(1, _PRIME, NUM_HASHES, dtype=np.uint64)
+_HASH_B = _rng.integers(0, _PRIME, NUM_HASHES, dtype=np.uint64)
+
+def spectral_peaks(y):
+    """(frame, bin) of every constellation peak, in time order"""
+    import librosa
+    from scipy.ndimage import maximum_filter
+
+    S_db = librosa.amplitude_to_db(np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)), ref=np.max)
+    peaks = (S_db == maximum_filter(S_db, size=PEAK_NEIGHBOURHOOD)) & (S_db > -PEAK_RANGE_DB)
+    bins, frames = np.nonzero(peaks)
+
+    second = frames * HOP_LENGTH // SAMPLE_RATE
+    order = np.lexsort((-S_db[bins, frames], second))
+    first = np.searchsorted(second[order], second[order])
+    keep = order[np.arange(len(order)) - first < PEAKS_PER_SECOND]
+
+    keep = keep[np.argsort(frames[keep], kind="stable")]
+    return frames[keep], bins[keep]
+
+def landmarks(frames, bins):
+    """Unique (f1, f2, dt) landmark hashes on the coarse grid, packed into integers"""
+    frames, bins = frames // TIME_QUANT, bins // FREQ_QUANT
+    hashes = []
+    for offset in range(1, FAN_OUT + 1):
+        dt = frames[offset:] - frames[:-offset]
+        keep = (dt > 0) & (dt <= MAX_DT)
+        hashes.append((bins[:-offset][keep] << 12) | (bins[offset:][keep] << 4) | dt[keep])
+    return np.unique(np.concatenate(hashes)) if hashes else np.zeros(0, dtype=np.int64)
+
+def minhash(values):
+    """NUM_HASHES minimums of (a*x + b) mod p over the landmark set"""
+    values = np.asarray(values, dtype=np.uint64)
+    signature = np.full(NUM_HASHES, _PRIME, dtype=np.uint64)
+    for start in range(0, len(values), MINHASH_CHUNK):
+        chunk = values[start:start + MINHASH_CHUNK]
+        hashed = (np.outer(_HASH_A, chunk) + _HASH_B[:, None]) % _PRIME
+        signature = np.minimum(signature, hashed.min(axis=1))
+    return signature.astype(np.uint32)
+
+def fingerprint_audio(y, sr=SAMPLE_RATE):
+    """MinHash signature of mono audio (resampled to SAMPLE_RATE), or None if it has no peaks (silence)"""
+    if sr != SAMPLE_RATE:
+        import librosa
+
+        y = librosa.resample(np.asarray(y), orig_sr=sr, target_sr=SAMPLE_RATE)
+    values = landmarks(*spectral_peaks(y))
+    return minhash(values) if len(values) else None
+
+def fingerprint_file(file_path):
+    import librosa
+
+    y, _ = librosa.load(file_path, sr=SAMPLE_RATE, mono=True)
+    return fingerprint_audio(y)
+
+def encode(signature):
+    """Hex text for the audio_fingerprint column"""
+    return signature.astype(">u4").tobytes().hex()
+
+def decode(text):
+    return np.frombuffer(bytes.fromhex(text), dtype=">u4").astype(np.uint32)
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures' landmark sets"""
+    return float(np.mean(a == b))
+
+def band_buckets(signature):
+    """(band, bucket) keys; duplicates share at least one with high probability"""
+    raw = signature.astype(">u4").tobytes()
+    width = BAND_ROWS * 4
+    return [(band, raw[band * width:(band + 1) * width].hex()) for band in range(NUM_BANDS)]
+
+class DuplicateIndex:
+    """In-memory LSH buckets: each signature is only compared with those sharing a bucket"""
+
+    def __init__(self, threshold=DUPLICATE_SIMILARITY):
+        self.threshold = threshold
+        self.signatures = {}
+        self.buckets = {}
+
+    def matches(self, signature):
+        """[(key, similarity)] of indexed signatures at or above the threshold, best first"""
+        candidates = set()
+        for bucket in band_buckets(signature):
+            candidates.update(self.buckets.get(bucket, ()))
+        found = [(key, similarity(signature, self.signatures[key])) for key in candidates]
+        return sorted([m for m in found if m[1] >= self.threshold], key=lambda m: -m[1])
+
+    def add(self, key, signature):
+        self.signatures[key] = signature
+        for bucket in band_buckets(signature):
+            self.buckets.setdefault(bucket, []).append(key)
+
+    def groups(self):
+        """Lists of keys that are duplicates of each other (connected through matches)"""
+        parent = {key: key for key in self.signatures}
+
+        def root(key):
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for key, signature in self.signatures.items():
+            for other, _ in self.matches(signature):
+                parent[root(other)] = root(key)
+
+        groups = {}
+        for key in self.signatures:
+            groups.setdefault(root(key), []).append(key)
+        return [sorted(keys) for keys in groups.values() if len(keys) > 1]
+
+def _fingerprint_entry(file_path):
+    try:
+        return file_path, fingerprint_file(file_path), None
+    except Exception as e:
+        return file_path, None, str(e)
+
+def main():
+    from analyze_audio import read_file_list
+
+    parser = argparse.ArgumentParser(description="Find duplicate and near-duplicate audio files")
+    parser.add_argument("--files-from", default="-", metavar="PATH",
+                        help="File list, one path per line ('-' reads stdin)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threshold", type=float, default=DUPLICATE_SIMILARITY,
+                        help="Minimum estimated similarity for a duplicate")
+    args = parser.parse_args()
+
+    index = DuplicateIndex(args.threshold)
+    errors = []
+    with Pool(processes=args.workers) as pool:
+        for path, signature, error in pool.imap_unordered(_fingerprint_entry, read_file_list(args.files_from)):
+            if error:
+                errors.append({"file": path, "error": error})
+            elif signature is not None:
+                index.add(path, signature)
+
+    print(json.dumps({
+        "files": len(index.signatures),
+        "duplicate_groups": index.groups(),
+        "errors": errors
+    }))
+
+if __name__ == "__main__":
+    main()
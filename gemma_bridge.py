@@ -6,17 +6,14 @@ Simple Python bridge for Gemma model integration
 
 import sys
 import json
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import torch
-
-model_name = "google/gemma-2-2b"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForCausalLM.from_pretrained(model_name, device_map="auto")
+import model_server
 
 def run_gemma(prompt):
-    inputs = tokenizer(prompt, return_tensors="pt").to("mps")
-    outputs = model.generate(**inputs, max_new_tokens=200)
-    return tokenizer.decode(outputs[0], skip_special_tokens=True)
+    # Greedy decode of the full text, served by the resident model server
+    reply = model_server.generate(prompt, **model_server.BRIDGE_PARAMS)
+    if "error" in reply:
+        raise RuntimeError(reply["error"])
+    return reply["response"]
 
 if __name__ == "__main__":
     prompt = sys.argv[1]
@@ -0,0 +1,146 @@
+"""
+JSON-lines IPC for Music Assistant
+Newline-delimited JSON requests and replies over a Unix socket or stdin/stdout
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import subprocess
+import threading
+import socketserver
+
+def socket_path(name):
+    """Default socket for a named service, overridable with MUSIC_ASSISTANT_<NAME>_SOCKET"""
+    override = os.environ.get(f"MUSIC_ASSISTANT_{name.upper()}_SOCKET")
+    return override or os.path.join(tempfile.gettempdir(), f"music_assistant_{name}.sock")
+
+def _replies(handler, request):
+    """Run handler(request) and tag its replies with the request id; the last one carries done=True"""
+    try:
+        replies = iter(handler(request))
+        reply = next(replies, None)
+        while reply is not None:
+            following = next(replies, None)
+            if "id" in request:
+                reply["id"] = request["id"]
+            if following is None:
+                reply["done"] = True
+            yield reply
+            reply = following
+    except Exception as e:
+        reply = {"error": str(e), "done": True}
+        if "id" in request:
+            reply["id"] = request["id"]
+        yield reply
+
+def _handle_lines(lines, write, handler):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            write({"error": f"Invalid JSON: {e}", "done": True})
+            continue
+        for reply in _replies(handler, request):
+            write(reply)
+
+class _StreamHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        def write(reply):
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+            self.wfile.flush()
+
+        try:
+            _handle_lines((line.decode() for line in self.rfile), write, self.server.handler)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+class _SocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve_socket(path, handler, stop=None):
+    """Serve handler(request) -> iterable of reply dicts on a Unix socket until stop is set"""
+    if os.path.exists(path):
+        if is_listening(path):
+            raise RuntimeError(f"Another server is already listening on {path}")
+        os.unlink(path)
+
+    server = _SocketServer(path, _StreamHandler)
+    server.handler = handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        (stop or threading.Event()).wait()
+    finally:
+        server.shutdown()
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+def serve_stdio(handler, stop=None):
+    """Serve JSON lines on stdin/stdout, one thread per request; other prints go to stderr"""
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    lock = threading.Lock()
+    workers = []
+
+    def write(reply):
+        with lock:
+            out.write(json.dumps(reply) + "\n")
+            out.flush()
+
+    for line in sys.stdin:
+        worker = threading.Thread(target=_handle_lines, args=([line], write, handler))
+        worker.start()
+        workers.append(worker)
+        workers = [w for w in workers if w.is_alive()]
+        if stop is not None and stop.is_set():
+            break
+
+    for worker in workers:
+        worker.join()
+
+def is_listening(path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+        return True
+    except OSError:
+        return False
+
+def wait_for(path, timeout):
+    """Poll until a server accepts connections on path, or the timeout passes"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if is_listening(path):
+            return True
+        time.sleep(0.1)
+    return False
+
+def start_daemon(script, path, args=(), timeout=60):
+    """Start script as a detached server on path and wait until it accepts connections"""
+    name = os.path.splitext(os.path.basename(script))[0]
+    log = open(os.path.join(os.path.dirname(path), f"music_assistant_{name}.log"), "a")
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(script), "--socket", path] + list(args),
+        stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True
+    )
+    return wait_for(path, timeout)
+
+def call(path, payload, timeout=None):
+    """Send one request and yield its replies until the one marked done"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(payload) + "\n").encode())
+        with sock.makefile("r") as replies:
+            for line in replies:
+                reply = json.loads(line)
+                yield reply
+                if reply.get("done"):
+                    return
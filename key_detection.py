@@ -0,0 +1,118 @@
+"""
+Key Detection for Music Assistant
+Krumhansl-Kessler key estimation: chroma vectors are correlated against all
+24 major/minor key profiles in one matrix multiply, for one file or a batch
+"""
+
+import sys
+import json
+import sqlite3
+import numpy as np
+
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+MODES = ("major", "minor")
+
+# Krumhansl & Kessler (1982) probe-tone ratings with the tonic at index 0
+MAJOR_PROFILE = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+MINOR_PROFILE = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+
+def _key_profiles():
+    """(24, 12) centred unit-norm profiles: rows 0-11 major on C..B, rows 12-23 minor"""
+    profiles = np.array([np.roll(profile, tonic)
+                         for profile in (MAJOR_PROFILE, MINOR_PROFILE) for tonic in range(12)])
+    profiles -= profiles.mean(axis=1, keepdims=True)
+    return profiles / np.linalg.norm(profiles, axis=1, keepdims=True)
+
+KEY_PROFILES = _key_profiles()
+KEY_NAMES = [f"{pitch_class} {mode}" for mode in MODES for pitch_class in PITCH_CLASSES]
+
+def key_scores(chroma):
+    """Pearson correlation of each chroma vector (n, 12) with the 24 key profiles, as (n, 24)"""
+    chroma = np.atleast_2d(np.asarray(chroma, dtype=np.float64))
+    centred = chroma - chroma.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centred, axis=1, keepdims=True)
+    centred = np.divide(centred, norms, out=np.zeros_like(centred), where=norms > 0)
+    return centred @ KEY_PROFILES.T
+
+def estimate_keys(chroma):
+    """Key of each chroma vector in a batch: [{"key", "tonic", "mode", "confidence"}, ...].
+
+    confidence is the correlation with the winning profile, clipped to 0..1;
+    flat (silent) chroma scores 0 everywhere and comes out as C major with confidence 0.
+    """
+    scores = key_scores(chroma)
+    best = scores.argmax(axis=1)
+    confidence = np.clip(scores[np.arange(len(best)), best], 0.0, 1.0)
+    return [{
+        "key": KEY_NAMES[index],
+        "tonic": index % 12,
+        "mode": MODES[index // 12],
+        "confidence": round(float(score), 3)
+    } for index, score in zip(best.tolist(), confidence)]
+
+def estimate_key(chroma):
+    """Key of a single 12-bin chroma vector"""
+    return estimate_keys(chroma)[0]
+
+def rekey_library(db_path, batch_size=10000):
+    """Re-estimate keys of stored analyzer results from their chroma, without decoding audio.
+
+    Updates harmonic_data of every sample_analysis row with a stored chroma
+    vector, and tracks.key of linked tracks; returns the number of rows updated.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        rows = conn.execute(
+            "SELECT id, sample_id, json_extract(spectral_data, '$.chroma') FROM sample_analysis "
+            "WHERE json_valid(spectral_data) AND json_extract(spectral_data, '$.chroma') IS NOT NULL"
+        ).fetchall()
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            chroma = np.array([json.loads(row[2]) for row in batch])
+            keys = estimate_keys(chroma)
+            with conn:
+                conn.executemany(
+                    "UPDATE sample_analysis SET harmonic_data = json_set(coalesce(harmonic_data, '{}'), "
+                    "'$.key', ?, '$.key_index', ?, '$.mode', ?, '$.confidence', ?), "
+                    "updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    [(key["key"], key["tonic"], key["mode"], key["confidence"], row[0])
+                     for row, key in zip(batch, keys)]
+                )
+                conn.executemany(
+                    "UPDATE tracks SET key = ? WHERE id = ?",
+                    [(key["key"], row[1]) for row, key in zip(batch, keys) if row[1] is not None]
+                )
+        return len(rows)
+    finally:
+        conn.close()
+
+def main():
+    if len(sys.argv) < 2:
+        print(json.dumps({"error": "No command provided"}))
+        return
+
+    command = sys.argv[1]
+
+    if command == "estimate":
+        # One chroma vector, or a JSON array of them
+        if len(sys.argv) < 3:
+            print(json.dumps({"error": "No chroma provided"}))
+            return
+        chroma = np.asarray(json.loads(sys.argv[2]), dtype=np.float64)
+        keys = estimate_keys(chroma)
+        print(json.dumps(keys[0] if chroma.ndim == 1 else keys))
+
+    elif command == "rekey":
+        from analysis_cache import DEFAULT_DB
+
+        db_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_DB
+        try:
+            print(json.dumps({"success": True, "db": db_path, "updated": rekey_library(db_path)}))
+        except sqlite3.Error as e:
+            print(json.dumps({"error": str(e)}))
+
+    else:
+        print(json.dumps({"error": f"Unknown command: {command}"}))
+
+if __name__ == "__main__":
+    main()
@@ -6,21 +6,56 @@ Uses Gemma model for local AI responses
 
 import sys
 import json
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import profiling
+import scheduler
 
-def load_model():
+MODEL_NAME = "google/gemma-2-2b"
+
+# auto: fp16 on cuda/mps, fp32 on cpu; int8: dynamic int8 quantization of the Linear layers (cpu only)
+INFERENCE_MODES = ("auto", "fp16", "bf16", "fp32", "int8")
+
+def select_device():
+    """Best available torch device: cuda, then Apple mps, then cpu"""
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def load_model(model_name=MODEL_NAME, mode="auto", device=None, threads=None):
     """Load the Gemma model and tokenizer"""
+    # torch/transformers are only needed where the model actually lives
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
     try:
-        model_name = "google/gemma-2-2b"
-        print(f"Loading model: {model_name}")
+        if threads:
+            torch.set_num_threads(threads)
+        device = "cpu" if mode == "int8" else (device or select_device())
+        if mode == "auto":
+            mode = "fp32" if device == "cpu" else "fp16"
+        dtype = {"fp16": torch.float16, "bf16": torch.bfloat16}.get(mode, torch.float32)
+
+        print(f"Loading model: {model_name} ({mode} on {device})")
         
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        model = AutoModelForCausalLM.from_pretrained(
-            model_name, 
-            device_map="auto",
-            torch_dtype=torch.float16
-        )
+        with profiling.stage("model_load"):
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model = AutoModelForCausalLM.from_pretrained(
+                model_name, 
+                torch_dtype=dtype,
+                low_cpu_mem_usage=True
+            ).to(device)
+            model.eval()
+
+            if mode == "int8":
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        # Keep one preallocated KV cache on the model and reuse it across generate() calls
+        model.generation_config.use_cache = True
+        if model.generation_config.cache_implementation is None:
+            model.generation_config.cache_implementation = "static"
         
         print("✅ Model loaded successfully")
         return model, tokenizer
@@ -28,35 +63,89 @@ def load_model():
         print(f"❌ Error loading model: {e}")
         return None, None
 
-def generate_response(prompt, model, tokenizer):
-    """Generate response using the local model"""
-    try:
-        # Prepare input
-        inputs = tokenizer(prompt, return_tensors="pt")
-        
-        # Move to same device as model
+class TokenStreamer:
+    """generate() streamer that reports each row's new text to on_token(row, text) as it is produced"""
+
+    def __init__(self, tokenizer, batch_size, on_token, stop_ids):
+        self.tokenizer = tokenizer
+        self.on_token = on_token
+        self.stop_ids = stop_ids
+        self.prompt_seen = False
+        self.tokens = [[] for _ in range(batch_size)]
+        self.texts = [""] * batch_size
+        self.finished = [False] * batch_size
+
+    def put(self, value):
+        # The first call carries the prompt ids, every later one a (batch,) tensor of new tokens
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+
+        for row, token_id in enumerate(value.reshape(-1).tolist()):
+            if self.finished[row]:
+                continue
+            if token_id in self.stop_ids:
+                self.finished[row] = True
+                continue
+            self.tokens[row].append(token_id)
+            text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+            # Hold back a partially decoded multi-byte character until it completes
+            if text.endswith("\ufffd"):
+                continue
+            delta = text[len(self.texts[row]):]
+            if delta:
+                self.texts[row] = text
+                self.on_token(row, delta)
+
+    def end(self):
+        pass
+
+def generate_batch(prompts, model, tokenizer, max_new_tokens=150, temperature=0.7,
+                   do_sample=True, strip_prompt=True, on_token=None):
+    """Generate replies for several prompts in one padded batch.
+
+    on_token(row, text) receives each row's text as it is produced. The prompt
+    is stripped by token position, not by searching the decoded string.
+    """
+    import torch
+
+    # Decoder-only models need left padding so every prompt ends at the same position
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    with profiling.stage("tokenize"):
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True)
         device = next(model.parameters()).device
         inputs = {k: v.to(device) for k, v in inputs.items()}
-        
-        # Generate response
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs, 
-                max_new_tokens=150,
-                temperature=0.7,
-                do_sample=True,
-                pad_token_id=tokenizer.eos_token_id
-            )
-        
-        # Decode response
-        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Remove the original prompt from response
-        if prompt in response:
-            response = response.replace(prompt, "").strip()
-        
-        return response
-        
+
+    options = {
+        "max_new_tokens": max_new_tokens,
+        "do_sample": do_sample,
+        "pad_token_id": tokenizer.pad_token_id
+    }
+    if do_sample:
+        options["temperature"] = temperature
+    if on_token is not None:
+        eos = model.generation_config.eos_token_id
+        stop_ids = set(eos if isinstance(eos, (list, tuple)) else [eos]) | {tokenizer.pad_token_id}
+        options["streamer"] = TokenStreamer(tokenizer, len(prompts), on_token, stop_ids)
+
+    # Interactive lease: a running scheduler pauses background scans meanwhile
+    with scheduler.slot("chat"), profiling.stage("generate"), torch.no_grad():
+        outputs = model.generate(**inputs, **options)
+
+    start = inputs["input_ids"].shape[1] if strip_prompt else 0
+    with profiling.stage("decode"):
+        return [tokenizer.decode(row[start:], skip_special_tokens=True).strip() for row in outputs]
+
+def generate_response(prompt, model, tokenizer, max_new_tokens=150, temperature=0.7,
+                      do_sample=True, strip_prompt=True):
+    """Generate response using the local model"""
+    try:
+        return generate_batch([prompt], model, tokenizer, max_new_tokens=max_new_tokens,
+                              temperature=temperature, do_sample=do_sample,
+                              strip_prompt=strip_prompt)[0]
     except Exception as e:
         return f"❌ Error generating response: {e}"
 
@@ -67,15 +156,38 @@ def main():
         return
     
     prompt = sys.argv[1]
+
+    # --stream prints {"token": ...} lines as text arrives, before the final result
+    on_token = None
+    if "--stream" in sys.argv[2:]:
+        def on_token(text):
+            print(json.dumps({"token": text}), flush=True)
     
-    # Load model
-    model, tokenizer = load_model()
-    if model is None or tokenizer is None:
-        print("❌ Failed to load model")
-        return
+    # --cache also caches this sampled reply (greedy replies are cached by default)
+    params = {"cache": True} if "--cache" in sys.argv[2:] else {}
+    # --profile adds per-stage timings (model load, tokenize, generate, decode)
+    if "--profile" in sys.argv[2:]:
+        params["profile"] = True
     
-    # Generate response
-    response = generate_response(prompt, model, tokenizer)
+    # The model server keeps Gemma loaded between prompts (started on first use)
+    import model_server
+    profile = None
+    try:
+        reply = model_server.generate(prompt, on_token=on_token, **params)
+        response = reply.get("response", reply.get("error"))
+        profile = reply.get("profile")
+    except (RuntimeError, OSError) as e:
+        print(f"⚠️ Model server unavailable ({e}), loading model in-process")
+
+        with profiling.profiled(params.get("profile", False)) as recorded:
+            model, tokenizer = load_model()
+            if model is None or tokenizer is None:
+                print("❌ Failed to load model")
+                return
+
+            response = generate_response(prompt, model, tokenizer)
+        if recorded is not None:
+            profile = recorded.report()
     
     # Return as JSON
     result = {
@@ -83,6 +195,8 @@ def main():
         "model": "gemma-2-2b",
         "local": True
     }
+    if profile is not None:
+        result["profile"] = profile
     
     print(json.dumps(result))
 
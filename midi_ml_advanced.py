@@ -1,10 +1,46 @@
-import sys, json, os
-import magenta.music as mm
-from magenta.models.melody_rnn import melody_rnn_sequence_generator
-from magenta.models.shared import sequence_generator_bundle
-from note_seq.protobuf import generator_pb2, music_pb2
-from magenta.models.music_vae import configs, MusicVAE
-import tensorflow as tf
+import sys, json, os, time
+import profiling
+import scheduler
+
+# Magenta/TensorFlow are imported inside the methods that need them, so the
+# CLI can hand a job to the resident midi_server without paying for them
+
+# MusicVAE decodes up to this many latents in one session run (variations only;
+# single progressions use a batch-1 model)
+VARIATION_BATCH_SIZE = 16
+VAE_CONFIG = 'hierdec-trio_16bar'
+
+# Spread of melody temperatures around the style's own, for variations
+VARIATION_TEMPERATURE_SPREAD = 0.25
+
+STYLE_TEMPERATURES = {
+    "trap": 0.8,       # More controlled
+    "jazz": 1.2,       # More creative
+    "classical": 0.6   # More structured
+}
+
+def parse_prompt(prompt, style="trap", key="C", tempo=140):
+    """Style, key and tempo named in the prompt, falling back to the given defaults"""
+    import re
+
+    # Parse style and key from prompt
+    for name in STYLE_TEMPERATURES:
+        if name in prompt.lower():
+            style = name
+            break
+
+    # Extract key from prompt
+    if "minor" in prompt.lower():
+        key = "C minor"
+    elif "major" in prompt.lower():
+        key = "C major"
+
+    # Extract tempo from prompt
+    tempo_match = re.search(r'(\d+)\s*bpm', prompt.lower())
+    if tempo_match:
+        tempo = int(tempo_match.group(1))
+
+    return style, key, tempo
 
 class MIDIMLGenerator:
     def __init__(self):
@@ -13,6 +49,14 @@ class MIDIMLGenerator:
     
     def load_models(self):
         """Load pre-trained Magenta models"""
+        with profiling.stage("model_load"):
+            self._load_models()
+
+    def _load_models(self):
+        from magenta.models.melody_rnn import melody_rnn_sequence_generator
+        from magenta.models.shared import sequence_generator_bundle
+        from magenta.models.music_vae import configs, MusicVAE
+
         try:
             # Melody RNN for melody generation
             bundle = sequence_generator_bundle.read_bundle_file("attention_rnn.mag")
@@ -21,7 +65,7 @@ class MIDIMLGenerator:
             self.models['melody'].initialize()
             
             # Music VAE for chord progression generation
-            config = configs.CONFIG_MAP['hierdec-trio_16bar']
+            config = configs.CONFIG_MAP[VAE_CONFIG]
             self.models['vae'] = MusicVAE(config, batch_size=1, checkpoint_dir_or_path=None)
             self.models['vae'].load_checkpoint()
             
@@ -29,43 +73,24 @@ class MIDIMLGenerator:
         except Exception as e:
             print(f"⚠️ Model loading error: {e}")
     
-    def generate_melody(self, prompt, style="trap", key="C", tempo=140):
-        """Generate melody based on prompt and style"""
+    def generate_melody(self, prompt, style="trap", key="C", tempo=140, temperature=None):
+        """Generate melody based on prompt and style (temperature overrides the style's)"""
+        from note_seq.protobuf import generator_pb2, music_pb2
+
         try:
-            # Parse style and key from prompt
-            if "trap" in prompt.lower():
-                style = "trap"
-            elif "jazz" in prompt.lower():
-                style = "jazz"
-            elif "classical" in prompt.lower():
-                style = "classical"
-            
-            # Extract key from prompt
-            if "minor" in prompt.lower():
-                key = "C minor"
-            elif "major" in prompt.lower():
-                key = "C major"
-            
-            # Extract tempo from prompt
-            import re
-            tempo_match = re.search(r'(\d+)\s*bpm', prompt.lower())
-            if tempo_match:
-                tempo = int(tempo_match.group(1))
+            style, key, tempo = parse_prompt(prompt, style, key, tempo)
             
             # Generate sequence based on style
             generator_options = generator_pb2.GeneratorOptions()
-            generator_options.args["temperature"].float_value = 1.0
             generator_options.generate_sections.add(start_time=0, end_time=30)
             
             # Style-specific generation
-            if style == "trap":
-                generator_options.args["temperature"].float_value = 0.8  # More controlled
-            elif style == "jazz":
-                generator_options.args["temperature"].float_value = 1.2  # More creative
-            elif style == "classical":
-                generator_options.args["temperature"].float_value = 0.6  # More structured
+            if temperature is None:
+                temperature = STYLE_TEMPERATURES.get(style, 1.0)
+            generator_options.args["temperature"].float_value = temperature
             
-            sequence = self.models['melody'].generate(music_pb2.NoteSequence(), generator_options)
+            with profiling.stage("melody_rnn"):
+                sequence = self.models['melody'].generate(music_pb2.NoteSequence(), generator_options)
             
             # Set tempo and key
             sequence.tempos[0].qpm = tempo
@@ -80,16 +105,92 @@ class MIDIMLGenerator:
         """Generate chord progression using Music VAE"""
         try:
             # Generate chord progression
-            z = self.models['vae'].sample(1)
-            chord_sequence = self.models['vae'].decode(z)
-            
-            return chord_sequence[0]
+            with profiling.stage("music_vae"):
+                return self.models['vae'].sample(1)[0]
         except Exception as e:
             print(f"❌ Chord generation error: {e}")
             return None
     
+    def variation_vae(self):
+        """MusicVAE that samples VARIATION_BATCH_SIZE progressions per run, loaded on first use"""
+        if 'vae_batch' not in self.models:
+            from magenta.models.music_vae import configs, MusicVAE
+
+            with profiling.stage("model_load"):
+                vae = MusicVAE(configs.CONFIG_MAP[VAE_CONFIG], batch_size=VARIATION_BATCH_SIZE,
+                               checkpoint_dir_or_path=None)
+                vae.load_checkpoint()
+            self.models['vae_batch'] = vae
+        return self.models['vae_batch']
+
+    def generate_chord_variations(self, n):
+        """Sample n chord progressions, a batch of them per VAE run"""
+        try:
+            vae = self.variation_vae()
+            sequences = []
+            for start in range(0, n, VARIATION_BATCH_SIZE):
+                with profiling.stage("music_vae"):
+                    sequences.extend(vae.sample(min(VARIATION_BATCH_SIZE, n - start)))
+            return sequences
+        except Exception as e:
+            print(f"❌ Chord variation error: {e}")
+            return None
+
+    def generate_melody_variations(self, prompt, n, temperatures=None, seeds=None, **options):
+        """n melodies from the one loaded Melody RNN, each with its own temperature and seed"""
+        import numpy as np
+
+        if temperatures is None:
+            style = parse_prompt(prompt, options.get("style", "trap"))[0]
+            base = STYLE_TEMPERATURES.get(style, 1.0)
+            if n > 1:
+                spread = np.linspace(base - VARIATION_TEMPERATURE_SPREAD, base + VARIATION_TEMPERATURE_SPREAD, n)
+                temperatures = [round(float(t), 3) for t in spread]
+            else:
+                temperatures = [base]
+        if seeds is None:
+            first = int(time.time()) % 100000
+            seeds = list(range(first, first + n))
+
+        melodies = []
+        for temperature, seed in zip(temperatures, seeds):
+            # Melody RNN samples each step with numpy
+            np.random.seed(seed)
+            melodies.append((self.generate_melody(prompt, temperature=temperature, **options),
+                             temperature, seed))
+        return melodies
+
+    def generate_variations(self, prompt, n=8, temperatures=None, seeds=None, output_dir="", **options):
+        """Generate n melody+chord candidates and save each as its own MIDI file"""
+        chords = self.generate_chord_variations(n)
+        if not chords:
+            return {"error": "Failed to generate chords"}
+
+        stamp = int(time.time())
+        variations = []
+        melodies = self.generate_melody_variations(prompt, n, temperatures, seeds, **options)
+        for index, ((melody_seq, temperature, seed), chord_seq) in enumerate(zip(melodies, chords)):
+            if not melody_seq:
+                variations.append({"error": "Failed to generate melody", "seed": seed})
+                continue
+            combined_seq = self.combine_melody_chords(melody_seq, chord_seq)
+            filename = f"ml_variation_{stamp}_{index + 1:02d}.mid"
+            if combined_seq and self.save_midi(combined_seq, os.path.join(output_dir, filename)):
+                variations.append({"file": filename, "temperature": temperature, "seed": seed})
+            else:
+                variations.append({"error": "Failed to save MIDI file", "seed": seed})
+
+        return {
+            "success": any("file" in v for v in variations),
+            "variations": variations,
+            "style": "ml_advanced",
+            "prompt": prompt
+        }
+
     def combine_melody_chords(self, melody_seq, chord_seq):
         """Combine melody and chord sequences"""
+        from note_seq.protobuf import music_pb2
+
         try:
             # Create combined sequence
             combined = music_pb2.NoteSequence()
@@ -104,10 +205,78 @@ class MIDIMLGenerator:
             print(f"❌ Combination error: {e}")
             return None
     
+    def generate_raw_melody(self, temperature=1.0, seconds=30):
+        """Unconditioned Melody RNN output, as midi_gen.py has always produced"""
+        from note_seq.protobuf import generator_pb2, music_pb2
+
+        generator_options = generator_pb2.GeneratorOptions()
+        generator_options.args["temperature"].float_value = temperature
+        generator_options.generate_sections.add(start_time=0, end_time=seconds)
+        with profiling.stage("melody_rnn"):
+            return self.models['melody'].generate(music_pb2.NoteSequence(), generator_options)
+
+    def run_job(self, job):
+        """Generate and save one MIDI file for a job dict; returns the result dict for the CLI.
+
+        Relative output paths resolve against job["cwd"] (the client's directory) when given.
+        Runs under an interactive scheduler lease, so background scans are paused meanwhile.
+        """
+        with scheduler.slot("generate"):
+            return self._run_job(job)
+
+    def _run_job(self, job):
+        prompt = job.get("prompt", "")
+        cwd = job.get("cwd", "")
+
+        if job.get("kind") == "variations":
+            return self.generate_variations(prompt, n=job.get("count", 8),
+                                            temperatures=job.get("temperatures"), seeds=job.get("seeds"),
+                                            output_dir=os.path.join(cwd, job.get("output_dir", "")),
+                                            style=job.get("style", "trap"), key=job.get("key", "C"),
+                                            tempo=job.get("tempo", 140))
+
+        if job.get("kind") == "melody":
+            sequence = self.generate_raw_melody(temperature=job.get("temperature", 1.0))
+            filename = job.get("output") or "generated.mid"
+            if not self.save_midi(sequence, os.path.join(cwd, filename)):
+                return {"error": "Failed to save MIDI file"}
+            return {"file": filename}
+
+        # Generate melody
+        melody_seq = self.generate_melody(prompt, style=job.get("style", "trap"),
+                                          key=job.get("key", "C"), tempo=job.get("tempo", 140))
+        if not melody_seq:
+            return {"error": "Failed to generate melody"}
+
+        # Generate chord progression
+        chord_seq = self.generate_chord_progression()
+        if not chord_seq:
+            return {"error": "Failed to generate chords"}
+
+        # Combine melody and chords
+        combined_seq = self.combine_melody_chords(melody_seq, chord_seq)
+        if not combined_seq:
+            return {"error": "Failed to combine sequences"}
+
+        # Save MIDI file
+        filename = job.get("output") or f"ml_generated_{int(time.time())}.mid"
+        if not self.save_midi(combined_seq, os.path.join(cwd, filename)):
+            return {"error": "Failed to save MIDI file"}
+
+        return {
+            "success": True,
+            "file": filename,
+            "style": "ml_advanced",
+            "prompt": prompt
+        }
+
     def save_midi(self, sequence, filename="generated.mid"):
         """Save sequence as MIDI file"""
+        import magenta.music as mm
+
         try:
-            mm.sequence_proto_to_midi_file(sequence, filename)
+            with profiling.stage("save_midi"):
+                mm.sequence_proto_to_midi_file(sequence, filename)
             return filename
         except Exception as e:
             print(f"❌ MIDI save error: {e}")
@@ -119,44 +288,34 @@ def main():
         return
     
     prompt = sys.argv[1]
-    generator = MIDIMLGenerator()
+
+    # --variations N: N candidates from one batched VAE decode and one Melody RNN session
+    job = {}
+    if "--variations" in sys.argv[2:]:
+        index = sys.argv.index("--variations")
+        count = int(sys.argv[index + 1]) if index + 1 < len(sys.argv) else 8
+        job = {"kind": "variations", "count": count}
+    # --profile adds per-stage timings (model load, Melody RNN, MusicVAE, MIDI save)
+    if "--profile" in sys.argv[2:]:
+        job["profile"] = True
     
     try:
-        # Generate melody
-        melody_seq = generator.generate_melody(prompt)
-        if not melody_seq:
-            print(json.dumps({"error": "Failed to generate melody"}))
-            return
-        
-        # Generate chord progression
-        chord_seq = generator.generate_chord_progression()
-        if not chord_seq:
-            print(json.dumps({"error": "Failed to generate chords"}))
-            return
-        
-        # Combine melody and chords
-        combined_seq = generator.combine_melody_chords(melody_seq, chord_seq)
-        if not combined_seq:
-            print(json.dumps({"error": "Failed to combine sequences"}))
-            return
-        
-        # Save MIDI file
-        filename = f"ml_generated_{int(time.time())}.mid"
-        result_file = generator.save_midi(combined_seq, filename)
-        
-        if result_file:
-            print(json.dumps({
-                "success": True,
-                "file": result_file,
-                "style": "ml_advanced",
-                "prompt": prompt
-            }))
-        else:
-            print(json.dumps({"error": "Failed to save MIDI file"}))
+        # The resident midi_server keeps the models loaded (started on first use)
+        import midi_server
+        try:
+            result = midi_server.generate(prompt, **job)
+        except (RuntimeError, OSError) as e:
+            print(f"⚠️ MIDI server unavailable ({e}), loading models in-process")
+            with profiling.profiled(job.get("profile", False)) as recorded:
+                result = MIDIMLGenerator().run_job(dict(job, prompt=prompt))
+            if recorded is not None:
+                result["profile"] = recorded.report()
+
+        result.pop("done", None)
+        print(json.dumps(result))
             
     except Exception as e:
         print(json.dumps({"error": f"Generation failed: {str(e)}"}))
 
 if __name__ == "__main__":
-    import time
     main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+MIDI Generation Server for Music Assistant
+Keeps the Melody RNN and MusicVAE sessions warm and takes generation jobs
+as JSON lines over a Unix socket (default) or stdin/stdout
+"""
+
+import os
+import sys
+import time
+import base64
+import shutil
+import argparse
+import tempfile
+import contextlib
+import threading
+import json_ipc
+import profiling
+
+SERVICE_NAME = "midi"
+STARTUP_TIMEOUT = 300  # TensorFlow graph build and checkpoint restore
+
+class MIDIServer:
+    def __init__(self):
+        from midi_ml_advanced import MIDIMLGenerator
+
+        start = time.time()
+        self.generator = MIDIMLGenerator()
+        self.lock = threading.Lock()  # one TF session, one job at a time
+        self.stop = threading.Event()
+        self.stats = {"jobs": 0, "load_seconds": round(time.time() - start, 2)}
+
+    def handle(self, request):
+        command = request.get("cmd", "generate")
+
+        if command == "ping":
+            yield {"ok": True, "models": sorted(self.generator.models)}
+        elif command == "stats":
+            yield dict(self.stats)
+        elif command == "shutdown":
+            self.stop.set()
+            yield {"ok": True}
+        elif command == "generate":
+            yield self.generate(request)
+        else:
+            yield {"error": f"Unknown command: {command}"}
+
+    def generate(self, job):
+        """Run one job; with "return": "bytes" the MIDI comes back base64-encoded instead of as paths"""
+        want_bytes = job.get("return") == "bytes"
+        if want_bytes:
+            scratch = tempfile.mkdtemp()
+            job = dict(job, cwd=scratch, output_dir="", output=job.get("output") or "generated.mid")
+
+        start = time.time()
+        with self.lock, profiling.profiled(job.get("profile", False)) as recorded:
+            result = self.generator.run_job(job)
+        if recorded is not None:
+            result["profile"] = recorded.report()
+        self.stats["jobs"] += 1
+        result["seconds"] = round(time.time() - start, 3)
+
+        if want_bytes:
+            for entry in [result] + result.get("variations", []):
+                if "file" in entry:
+                    path = os.path.join(scratch, entry.pop("file"))
+                    with open(path, "rb") as f:
+                        entry["midi_base64"] = base64.b64encode(f.read()).decode()
+            shutil.rmtree(scratch, ignore_errors=True)
+        return result
+
+def generate(prompt, autostart=True, **job):
+    """Client: send one generation job to the server.
+
+    Job fields: style, tempo, key, output, return ("path" or "bytes") and kind
+    ("melody", "variations" with count/temperatures/seeds/output_dir, or the
+    default melody plus chords).
+    """
+    path = json_ipc.socket_path(SERVICE_NAME)
+    if not json_ipc.is_listening(path):
+        if not autostart or not json_ipc.start_daemon(__file__, path, timeout=STARTUP_TIMEOUT):
+            raise RuntimeError(f"No MIDI server listening on {path}")
+
+    request = dict(job, prompt=prompt, cwd=os.getcwd())
+    for reply in json_ipc.call(path, request):
+        if reply.get("done"):
+            return reply
+    raise RuntimeError("MIDI server closed the connection")
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep Magenta models loaded between generation requests")
+    parser.add_argument("--socket", default=json_ipc.socket_path(SERVICE_NAME),
+                        help="Unix socket to listen on")
+    parser.add_argument("--stdio", action="store_true",
+                        help="Speak JSON lines on stdin/stdout instead of a socket")
+    args = parser.parse_args()
+
+    # Model loading chatter must not end up in the stdio protocol stream
+    with contextlib.redirect_stdout(sys.stderr if args.stdio else sys.stdout):
+        server = MIDIServer()
+
+    if args.stdio:
+        json_ipc.serve_stdio(server.handle, stop=server.stop)
+    else:
+        print(f"🎹 MIDI server listening on {args.socket}")
+        sys.stdout.flush()
+        json_ipc.serve_socket(args.socket, server.handle, stop=server.stop)
+
+if __name__ == "__main__":
+    main()
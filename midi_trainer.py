@@ -1,60 +1,79 @@
 import sys, json, os
-import magenta.music as mm
-from magenta.models.melody_rnn import melody_rnn_sequence_generator
-from magenta.models.shared import sequence_generator_bundle
-from note_seq.protobuf import generator_pb2, music_pb2
-import tensorflow as tf
 import numpy as np
+import note_store
+from note_store import NoteStore
+from key_detection import PITCH_CLASSES, estimate_keys
+import scheduler
+
+# Magenta/TensorFlow are imported inside the functions that need them, so
+# loading or saving the learned style doesn't pay for them
+
+def parse_midi_notes(midi_file):
+    """Tempo, key and columnar notes for one MIDI file (runs in a pool worker)"""
+    import magenta.music as mm
+
+    try:
+        sequence = mm.midi_file_to_sequence_proto(midi_file)
+    except Exception as e:
+        return {"error": str(e)}
+
+    return {
+        "tempo": sequence.tempos[0].qpm if sequence.tempos else None,
+        "key": sequence.key_signatures[0].key if sequence.key_signatures else None,
+        "notes": note_store.notes_from_sequence(sequence)
+    }
+
+def parse_for_training(midi_file):
+    """parse_midi_notes for one file of a training run, after waiting out any interactive work"""
+    scheduler.checkpoint("train")
+    return parse_midi_notes(midi_file)
 
 class MIDITrainer:
     def __init__(self):
         self.training_data = []
         self.user_style = {}
     
-    def analyze_midi_library(self, midi_files):
-        """Analyze user's MIDI library to learn their style"""
+    def analyze_midi_library(self, midi_files, workers=None, store_path=note_store.DEFAULT_PATH):
+        """Analyze user's MIDI library to learn their style.
+
+        Only files that are new or changed since the last run (by mtime and
+        size) are parsed, across a process pool, into the columnar note store;
+        the statistics are computed over the store's arrays.
+        """
         try:
-            style_patterns = {
-                'tempo_ranges': [],
-                'key_signatures': [],
-                'note_patterns': [],
-                'rhythm_patterns': [],
-                'chord_progressions': []
-            }
-            
-            for midi_file in midi_files:
-                if not os.path.exists(midi_file):
-                    continue
-                
-                # Load MIDI file
-                sequence = mm.midi_file_to_sequence_proto(midi_file)
-                
-                # Analyze tempo
-                if sequence.tempos:
-                    tempo = sequence.tempos[0].qpm
-                    style_patterns['tempo_ranges'].append(tempo)
-                
-                # Analyze key signature
-                if sequence.key_signatures:
-                    key = sequence.key_signatures[0].key
-                    style_patterns['key_signatures'].append(key)
-                
-                # Analyze note patterns
-                notes = [note.pitch for note in sequence.notes]
-                if notes:
-                    style_patterns['note_patterns'].extend(notes)
-                
-                # Analyze rhythm patterns
-                durations = [note.end_time - note.start_time for note in sequence.notes]
-                if durations:
-                    style_patterns['rhythm_patterns'].extend(durations)
+            store = NoteStore(store_path)
+            midi_files = [path for path in midi_files if os.path.exists(path)]
+
+            stale = store.stale(midi_files)
+            if stale:
+                paths = [path for path, _ in stale]
+                workers = min(workers or os.cpu_count() or 1, len(paths))
+                if workers > 1:
+                    pool, pids = scheduler.worker_pool(workers)
+                    with pool, scheduler.slot("train", pids=pids, cpus=workers):
+                        parsed = pool.map(parse_for_training, paths)
+                else:
+                    with scheduler.slot("train"):
+                        parsed = [parse_for_training(path) for path in paths]
+                store.update([(path, signature, result) for (path, signature), result in zip(stale, parsed)])
+
+            notes, tempos, keys = store.select(midi_files)
             
             # Calculate style statistics
             self.user_style = {
-                'avg_tempo': np.mean(style_patterns['tempo_ranges']) if style_patterns['tempo_ranges'] else 120,
-                'common_keys': self._get_common_keys(style_patterns['key_signatures']),
-                'note_range': self._get_note_range(style_patterns['note_patterns']),
-                'rhythm_style': self._analyze_rhythm_style(style_patterns['rhythm_patterns'])
+                'avg_tempo': float(np.nanmean(tempos)) if np.any(~np.isnan(tempos)) else 120,
+                'common_keys': self._get_common_keys(notes, len(tempos)),
+                'note_range': self._get_note_range(notes),
+                'rhythm_style': self._analyze_rhythm_style(notes),
+                'interval_histogram': note_store.interval_histogram(notes).tolist(),
+                'onset_grid': note_store.onset_grid(notes, tempos).tolist(),
+                'pitch_class_profiles': {
+                    f"Key {k}": profile.round(4).tolist()
+                    for k, profile in enumerate(note_store.pitch_class_profiles(notes, keys))
+                    if profile.any()
+                },
+                'files_analyzed': len(store.parsed(midi_files)),
+                'files_parsed': len(stale)
             }
             
             return self.user_style
@@ -63,36 +82,35 @@ class MIDITrainer:
             print(f"❌ Library analysis error: {e}")
             return None
     
-    def _get_common_keys(self, keys):
-        """Find most common keys in user's library"""
-        if not keys:
+    def _get_common_keys(self, notes, file_count):
+        """Find most common keys in user's library, estimated from each file's notes"""
+        histograms = note_store.pitch_class_histograms(notes, file_count)
+        histograms = histograms[histograms.any(axis=1)]
+        if not histograms.size:
             return ['C major']
         
-        key_counts = {}
-        for key in keys:
-            key_counts[key] = key_counts.get(key, 0) + 1
-        
-        # Return top 3 most common keys
-        sorted_keys = sorted(key_counts.items(), key=lambda x: x[1], reverse=True)
-        return [f"Key {k}" for k, _ in sorted_keys[:3]]
+        # Return top 3 most common keys (all files scored in one batch)
+        values, counts = np.unique([key["key"] for key in estimate_keys(histograms)], return_counts=True)
+        return values[np.argsort(-counts, kind='stable')[:3]].tolist()
     
     def _get_note_range(self, notes):
         """Analyze note range in user's library"""
-        if not notes:
+        if not notes.size:
             return {'min': 60, 'max': 84}  # C4 to C6
         
+        pitches = notes['pitch']
         return {
-            'min': min(notes),
-            'max': max(notes),
-            'avg': np.mean(notes)
+            'min': int(pitches.min()),
+            'max': int(pitches.max()),
+            'avg': float(pitches.mean())
         }
     
-    def _analyze_rhythm_style(self, durations):
+    def _analyze_rhythm_style(self, notes):
         """Analyze rhythm patterns in user's library"""
-        if not durations:
+        if not notes.size:
             return 'standard'
         
-        avg_duration = np.mean(durations)
+        avg_duration = float(np.mean(notes['end'] - notes['start']))
         if avg_duration < 0.5:
             return 'fast'
         elif avg_duration > 2.0:
@@ -102,6 +120,10 @@ class MIDITrainer:
     
     def generate_personalized_melody(self, prompt, user_style):
         """Generate melody based on user's learned style"""
+        from magenta.models.melody_rnn import melody_rnn_sequence_generator
+        from magenta.models.shared import sequence_generator_bundle
+        from note_seq.protobuf import generator_pb2, music_pb2
+
         try:
             # Load base model
             bundle = sequence_generator_bundle.read_bundle_file("attention_rnn.mag")
@@ -135,9 +157,13 @@ class MIDITrainer:
             
             # Apply user's key signature
             if sequence.key_signatures and user_style.get('common_keys'):
-                # Use most common key
-                common_key = user_style['common_keys'][0]
-                sequence.key_signatures[0].key = 0  # Simplified key mapping
+                # Use most common key, e.g. "A minor"
+                tonic, _, mode = user_style['common_keys'][0].partition(' ')
+                if tonic in PITCH_CLASSES:
+                    sequence.key_signatures[0].key = PITCH_CLASSES.index(tonic)
+                    sequence.key_signatures[0].mode = (music_pb2.NoteSequence.KeySignature.MINOR
+                                                       if mode == 'minor' else
+                                                       music_pb2.NoteSequence.KeySignature.MAJOR)
             
             return sequence
             
@@ -213,6 +239,7 @@ def main():
         
         if sequence:
             # Save MIDI file
+            import magenta.music as mm
             filename = f"personalized_{int(time.time())}.mid"
             mm.sequence_proto_to_midi_file(sequence, filename)
             
@@ -1,21 +1,39 @@
-import sys, json, librosa, numpy as np
-
-def analyze(file_path):
-    y, sr = librosa.load(file_path, sr=None)
-    S = np.abs(librosa.stft(y))
-    spectral_centroid = librosa.feature.spectral_centroid(S=S, sr=sr).mean()
-    spectral_bandwidth = librosa.feature.spectral_bandwidth(S=S, sr=sr).mean()
-    rms = librosa.feature.rms(y=y).mean()
+import sys, json
+from functools import partial
+from analysis_cache import AnalysisCache, DEFAULT_DB, analyzer_version
+import profiling
+import scheduler
+from feature_extractor import load_features
+from pcm_cache import PCMCache
+import feature_extractor
+
+ANALYZER_VERSION = analyzer_version("mix_match", 1, __file__, feature_extractor.__file__)
+
+def analyze(file_path, pcm_cache=None):
+    # Long stems and full mixes are analyzed block-wise to bound memory
+    features = load_features(file_path, pcm_cache=pcm_cache)
     return {
-        "centroid": float(spectral_centroid),
-        "bandwidth": float(spectral_bandwidth),
-        "rms": float(rms)
+        "centroid": features.centroid(),
+        "bandwidth": features.bandwidth(),
+        "rms": features.rms()
     }
 
-if __name__ == "__main__":
-    args = json.loads(sys.argv[1])
-    ref = analyze(args["refPath"])
-    mine = analyze(args["myPath"])
+def compare(ref_path, my_path, cache_db=None, profile=False, pcm_cache_dir=None):
+    """Reference vs. my mix: both feature sets plus mixing advice (and per-stage timings with profile)"""
+    with profiling.profiled(profile) as recorded, scheduler.slot("mix-match"):
+        # Optional pcm_cache_dir: read decoded audio from (and add it to) a PCM cache
+        pcm_cache = PCMCache(pcm_cache_dir) if pcm_cache_dir else None
+        analyzer = partial(analyze, pcm_cache=pcm_cache)
+        version = pcm_cache.version(ANALYZER_VERSION) if pcm_cache is not None else ANALYZER_VERSION
+        # Optional cache_db: reuse stored results for unchanged files
+        cache = AnalysisCache(cache_db) if cache_db else None
+        if cache is not None:
+            ref = cache.cached(ref_path, version, analyzer)
+            mine = cache.cached(my_path, version, analyzer)
+            cache.close()
+        else:
+            ref = analyzer(ref_path)
+            mine = analyzer(my_path)
 
     diff_centroid = mine["centroid"] - ref["centroid"]
     diff_bandwidth = mine["bandwidth"] - ref["bandwidth"]
@@ -37,8 +55,62 @@ if __name__ == "__main__":
     elif diff_rms < -0.02:
         advice.append("Your track is quieter/thinner (add compression/volume).")
 
-    print(json.dumps({
+    result = {
         "reference": ref,
         "mine": mine,
         "advice": advice
-    }))
+    }
+    if recorded is not None:
+        result["profile"] = recorded.report()
+    return result
+
+def compare_batch(my_paths, references, library_db=DEFAULT_DB, profile=False, pcm_cache_dir=None):
+    """Each mix against each reference (a stored reference name or an audio file) in one vectorized pass.
+
+    Profiles come from the reference library, so a reference (or an
+    unchanged mix) is only analyzed the first time it's compared. Returns
+    per-band and per-section differences and advice for every pair, closest
+    reference first for each mix.
+    """
+    from reference_library import ReferenceLibrary, compare_profiles, comparison_report
+
+    with profiling.profiled(profile) as recorded, scheduler.slot("mix-match"):
+        library = ReferenceLibrary(library_db, PCMCache(pcm_cache_dir) if pcm_cache_dir else None)
+        try:
+            mixes = [library.profile(path) for path in my_paths]
+            refs = [library.resolve(reference) for reference in references]
+        finally:
+            library.close()
+        with profiling.stage("compare"):
+            diffs = compare_profiles(mixes, refs)
+            comparisons = []
+            for m, mix in enumerate(mixes):
+                for r in diffs["distance"][m].argsort():
+                    report = comparison_report(diffs, m, r, mix["duration"])
+                    reference = refs[r]["name"] or refs[r]["file"]
+                    comparisons.append({"mix": mix["file"], "reference": reference, **report})
+
+    result = {"comparisons": comparisons}
+    if recorded is not None:
+        result["profile"] = recorded.report()
+    return result
+
+def main():
+    args = json.loads(sys.argv[1])
+    # Optional "profile": true adds per-stage timings; "pcmCache": DIR reuses decoded audio
+    if "references" in args or "mixes" in args:
+        # Batch mode: "mixes" (or "myPath") against "references" (or "refPath"), names or files
+        try:
+            result = compare_batch(args.get("mixes") or [args["myPath"]],
+                                   args.get("references") or [args["refPath"]],
+                                   args.get("libraryDb", DEFAULT_DB), args.get("profile", False),
+                                   args.get("pcmCache"))
+        except (KeyError, OSError, ValueError) as e:
+            result = {"error": str(e).strip("'")}
+        print(json.dumps(result))
+        return
+    print(json.dumps(compare(args["refPath"], args["myPath"], args.get("cacheDb"), args.get("profile", False),
+                             args.get("pcmCache"))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Model Server for Music Assistant
+Keeps the Gemma model loaded and answers prompts as JSON lines over a
+Unix socket (default) or stdin/stdout
+"""
+
+import os
+import sys
+import gc
+import time
+import argparse
+import threading
+import contextlib
+import queue
+import shlex
+import statistics
+import json_ipc
+import profiling
+from local_ai import INFERENCE_MODES, MODEL_NAME
+from response_cache import ResponseCache, is_cacheable, DEFAULT_PATH as DEFAULT_CACHE_PATH
+
+SERVICE_NAME = "model"
+STARTUP_TIMEOUT = 600  # first start downloads/loads the weights
+IDLE_CHECK_INTERVAL = 5
+
+# Dynamic batching: wait this long for more prompts to join a batch
+BATCH_WINDOW = 0.02
+MAX_BATCH_SIZE = 8
+
+# Prompts only share a batch when they decode the same way
+BATCH_KEYS = ("max_new_tokens", "temperature", "do_sample", "strip_prompt")
+DEFAULTS = {"max_new_tokens": 150, "temperature": 0.7, "do_sample": True, "strip_prompt": True}
+
+# Decode settings gemma_bridge.py sends
+BRIDGE_PARAMS = {"max_new_tokens": 200, "do_sample": False, "strip_prompt": False}
+
+# Decode settings of the clients --warm-cache-from seeds entries for. The bridge
+# is left out: its replies echo the prompt, and creative_sessions only records
+# the generated text, so a seeded hit would differ from a real reply.
+CLIENT_PARAMS = {
+    "chat": {},  # local_ai.py (only looks up the cache with --cache)
+}
+
+def decode_options(request):
+    """The request's BATCH_KEYS settings, defaults filled in"""
+    return {key: request.get(key, DEFAULTS[key]) for key in BATCH_KEYS}
+
+class Job:
+    def __init__(self, request):
+        self.prompt = request["prompt"]
+        self.stream = request.get("stream", False)
+        self.options = decode_options(request)
+        self.cacheable = is_cacheable(self.options, request.get("cache"))
+        self.profile = request.get("profile", False)
+        self.replies = queue.Queue()
+        self.queued_at = time.time()
+        self.first_token_at = None
+
+    @property
+    def batch_key(self):
+        return tuple(self.options[key] for key in BATCH_KEYS)
+
+    @property
+    def cache_params(self):
+        return dict(self.options, model=MODEL_NAME)
+
+class ModelServer:
+    def __init__(self, idle_unload=0, batch_window=BATCH_WINDOW, max_batch_size=MAX_BATCH_SIZE,
+                 load_options=None, cache=None):
+        self.model = None
+        self.tokenizer = None
+        self.load_options = load_options or {}
+        self.cache = cache
+        self.idle_unload = idle_unload
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.jobs = queue.Queue()
+        self.waiting = []  # jobs pulled off the queue that didn't fit the last batch
+        self.last_used = time.time()
+        self.batch_sizes = []
+        self.stats = {"requests": 0, "batches": 0, "cache_hits": 0, "loads": 0, "unloads": 0}
+
+    def ensure_loaded(self):
+        """Load the model on first use or after an idle unload (caller holds the lock)"""
+        if self.model is not None:
+            return
+        from local_ai import load_model
+
+        start = time.time()
+        self.model, self.tokenizer = load_model(**self.load_options)
+        if self.model is None:
+            raise RuntimeError("Failed to load model")
+        self.stats["loads"] += 1
+        self.stats["last_load_seconds"] = round(time.time() - start, 2)
+
+    def unload(self):
+        with self.lock:
+            if self.model is None:
+                return
+            self.model = None
+            self.tokenizer = None
+            gc.collect()
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            except ImportError:
+                pass
+            self.stats["unloads"] += 1
+            print("💤 Model unloaded after idle timeout")
+
+    def warm_up(self):
+        """Load the model and run one short generation so the first real prompt is fast"""
+        with self.lock:
+            self.ensure_loaded()
+            from local_ai import generate_response
+            generate_response("Hello", self.model, self.tokenizer, max_new_tokens=1, do_sample=False)
+            self.last_used = time.time()
+        print("🔥 Model warmed up")
+
+    def watch_idle(self):
+        while not self.stop.wait(IDLE_CHECK_INTERVAL):
+            if self.model is not None and time.time() - self.last_used > self.idle_unload:
+                self.unload()
+
+    def handle(self, request):
+        command = request.get("cmd", "generate")
+
+        if command == "ping":
+            yield {"ok": True, "loaded": self.model is not None, "options": self.load_options}
+        elif command == "stats":
+            sizes = self.batch_sizes[-100:]
+            stats = dict(self.stats, loaded=self.model is not None, queued=self.jobs.qsize(),
+                         mean_batch_size=round(statistics.mean(sizes), 2) if sizes else 0)
+            if self.cache is not None:
+                stats["cache"] = self.cache.stats()
+            yield stats
+        elif command == "shutdown":
+            self.stop.set()
+            yield {"ok": True}
+        elif command == "generate":
+            yield from self.generate(request)
+        else:
+            yield {"error": f"Unknown command: {command}"}
+
+    def generate(self, request):
+        """Serve a prompt from the response cache, or queue it for the batch worker and relay its replies"""
+        job = Job(request)
+        if self.cache is not None and job.cacheable:
+            response = self.cache.get(job.prompt, job.cache_params)
+            if response is not None:
+                self.stats["cache_hits"] += 1
+                if job.stream:
+                    yield {"token": response}
+                yield {"response": response, "model": MODEL_NAME, "local": True, "cached": True}
+                return
+
+        self.jobs.put(job)
+        while True:
+            reply = job.replies.get()
+            if reply is None:
+                return
+            yield reply
+
+    def next_batch(self):
+        """Block for one job, then gather compatible jobs that arrive within the batch window"""
+        batch = [self.waiting.pop(0) if self.waiting else self.jobs.get()]
+        deadline = time.time() + self.batch_window
+        leftovers = []
+
+        for job in self.waiting:
+            (batch if job.batch_key == batch[0].batch_key and len(batch) < self.max_batch_size
+             else leftovers).append(job)
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                job = self.jobs.get(timeout=remaining)
+            except queue.Empty:
+                break
+            (batch if job.batch_key == batch[0].batch_key else leftovers).append(job)
+
+        self.waiting = leftovers
+        return batch
+
+    def run_batches(self):
+        """Batch worker: one padded generate() call per batch, streaming tokens to the jobs that asked"""
+        from local_ai import generate_batch
+
+        while not self.stop.is_set():
+            batch = self.next_batch()
+
+            def on_token(row, text):
+                job = batch[row]
+                if job.first_token_at is None:
+                    job.first_token_at = time.time()
+                if job.stream:
+                    job.replies.put({"token": text})
+
+            try:
+                # One profile for the whole batch, reported to each job that asked for it
+                with profiling.profiled(any(job.profile for job in batch)) as recorded, self.lock:
+                    self.ensure_loaded()
+                    # The streamer re-decodes each row every step, so only batches that stream pay for it
+                    streaming = any(job.stream for job in batch)
+                    responses = generate_batch([job.prompt for job in batch], self.model, self.tokenizer,
+                                               on_token=on_token if streaming else None, **batch[0].options)
+                    self.last_used = time.time()
+            except Exception as e:
+                for job in batch:
+                    job.replies.put({"error": f"❌ Error generating response: {e}"})
+                    job.replies.put(None)
+                continue
+
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.batch_sizes = self.batch_sizes[-99:] + [len(batch)]
+
+            for job, response in zip(batch, responses):
+                if self.cache is not None and job.cacheable:
+                    self.cache.put(job.prompt, job.cache_params, response)
+                reply = {
+                    "response": response,
+                    "model": MODEL_NAME,
+                    "local": True,
+                    "batch_size": len(batch),
+                    "seconds": round(self.last_used - job.queued_at, 3)
+                }
+                if job.first_token_at is not None:
+                    reply["first_token_seconds"] = round(job.first_token_at - job.queued_at, 3)
+                if job.profile and recorded is not None:
+                    reply["profile"] = recorded.report()
+                job.replies.put(reply)
+                job.replies.put(None)
+
+def start_daemon(path):
+    """Start a detached model server on path and wait until it accepts connections.
+
+    Extra server flags (e.g. "--mode int8 --threads 4") come from MUSIC_ASSISTANT_MODEL_ARGS.
+    """
+    extra = shlex.split(os.environ.get("MUSIC_ASSISTANT_MODEL_ARGS", ""))
+    return json_ipc.start_daemon(__file__, path, extra, timeout=STARTUP_TIMEOUT)
+
+def generate(prompt, autostart=True, on_token=None, **params):
+    """Client: send one prompt to the model server, starting it if needed.
+
+    on_token(text) is called with each piece of the reply as it streams in.
+    """
+    path = json_ipc.socket_path(SERVICE_NAME)
+    if not json_ipc.is_listening(path):
+        if not autostart or not start_daemon(path):
+            raise RuntimeError(f"No model server listening on {path}")
+
+    request = dict(params, prompt=prompt, stream=on_token is not None)
+    for reply in json_ipc.call(path, request):
+        if "token" in reply and on_token is not None:
+            on_token(reply["token"])
+        if reply.get("done"):
+            return reply
+    raise RuntimeError("Model server closed the connection")
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the local Gemma model loaded between prompts")
+    parser.add_argument("--socket", default=json_ipc.socket_path(SERVICE_NAME),
+                        help="Unix socket to listen on")
+    parser.add_argument("--stdio", action="store_true",
+                        help="Speak JSON lines on stdin/stdout instead of a socket")
+    parser.add_argument("--idle-unload", type=float, default=900, metavar="SECONDS",
+                        help="Free the model after this long without requests (0 keeps it loaded)")
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW, metavar="SECONDS",
+                        help="How long to wait for concurrent prompts to join a batch")
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--mode", choices=INFERENCE_MODES, default="auto",
+                        help="Weights: auto picks fp16 on GPU and fp32 on CPU; int8 quantizes for CPU")
+    parser.add_argument("--device", default=None, help="Torch device (default: cuda, then mps, then cpu)")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads for inference")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, metavar="PATH",
+                        help="On-disk response cache (greedy requests are cached by default)")
+    parser.add_argument("--cache-max-mb", type=float, default=64)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the response cache")
+    parser.add_argument("--warm-cache-from", metavar="DB",
+                        help="Seed the cache from creative_sessions in this database")
+    parser.add_argument("--warm-cache-for", default=",".join(CLIENT_PARAMS), metavar="CLIENTS",
+                        help=f"Clients whose decode settings the seeded entries match ({', '.join(CLIENT_PARAMS)})")
+    parser.add_argument("--warm-up", action="store_true",
+                        help="Load the model and run a short generation before serving")
+    args = parser.parse_args()
+
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(args.cache, max_bytes=int(args.cache_max_mb * 1024 * 1024))
+        if args.warm_cache_from:
+            # Cache keys include the decode settings, so seed under exactly what each client sends
+            clients = args.warm_cache_for.split(",")
+            unknown = [client for client in clients if client not in CLIENT_PARAMS]
+            if unknown:
+                parser.error(f"Unknown --warm-cache-for client(s): {', '.join(unknown)}")
+            for client in clients:
+                params = dict(decode_options(CLIENT_PARAMS[client]), model=MODEL_NAME)
+                count = cache.warm_from_sessions(args.warm_cache_from, params)
+                print(f"📦 Warmed response cache with {count} creative sessions for {client}")
+
+    server = ModelServer(idle_unload=args.idle_unload, batch_window=args.batch_window,
+                         max_batch_size=args.max_batch_size,
+                         load_options={"mode": args.mode, "device": args.device, "threads": args.threads},
+                         cache=cache)
+    if args.warm_up:
+        # Model loading chatter must not end up in the stdio protocol stream
+        with contextlib.redirect_stdout(sys.stderr if args.stdio else sys.stdout):
+            server.warm_up()
+    threading.Thread(target=server.run_batches, daemon=True).start()
+    if args.idle_unload > 0:
+        threading.Thread(target=server.watch_idle, daemon=True).start()
+
+    if args.stdio:
+        json_ipc.serve_stdio(server.handle, stop=server.stop)
+    else:
+        print(f"🎧 Model server listening on {args.socket}")
+        sys.stdout.flush()
+        json_ipc.serve_socket(args.socket, server.handle, stop=server.stop)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Note Store for Music Assistant
+Every note of the user's MIDI library as one columnar NumPy array (memory-mapped
+from a .npy file), plus vectorized style statistics over it
+"""
+
+import os
+import json
+import numpy as np
+
+DEFAULT_PATH = "midi_notes"  # midi_notes.npy holds the notes, midi_notes.json the file index
+
+NOTE_DTYPE = np.dtype([
+    ("pitch", np.uint8),
+    ("velocity", np.uint8),
+    ("file_id", np.uint32),
+    ("start", np.float32),
+    ("end", np.float32)
+])
+
+# Melodic intervals are clipped to +/- this many semitones
+MAX_INTERVAL = 12
+
+# Onset grid resolution: sixteenth-note positions in a 4/4 bar
+GRID_STEPS = 16
+
+NO_KEY = -1
+
+def notes_from_sequence(sequence, file_id=0):
+    """Columnar copy of a NoteSequence's notes"""
+    return np.array(
+        [(n.pitch, n.velocity, file_id, n.start_time, n.end_time) for n in sequence.notes],
+        dtype=NOTE_DTYPE
+    )
+
+def file_signature(path):
+    info = os.stat(path)
+    return [info.st_mtime, info.st_size]
+
+class NoteStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.notes_path = path + ".npy"
+        self.index_path = path + ".json"
+        self.index = {"next_id": 0, "files": {}}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)
+        if os.path.exists(self.notes_path):
+            self.notes = np.load(self.notes_path, mmap_mode="r")
+        else:
+            self.notes = np.zeros(0, dtype=NOTE_DTYPE)
+
+    def stale(self, paths):
+        """(path, signature) for files that are new or changed since they were stored"""
+        stale = []
+        for path in paths:
+            signature = file_signature(path)
+            entry = self.index["files"].get(path)
+            if entry is None or entry["signature"] != signature:
+                stale.append((path, signature))
+        return stale
+
+    def update(self, parsed):
+        """Replace the notes of each (path, signature, result) and save.
+
+        result is {"tempo", "key", "notes"} or {"error"}; failed files are
+        remembered so they aren't parsed again until they change.
+        """
+        files = self.index["files"]
+        replaced = [files[path]["id"] for path, _, _ in parsed if path in files]
+        keep = self.notes[~np.isin(self.notes["file_id"], replaced)]
+
+        chunks = [keep]
+        for path, signature, result in parsed:
+            file_id = self.index["next_id"]
+            self.index["next_id"] += 1
+            entry = {"id": file_id, "signature": signature}
+            if "error" in result:
+                entry["error"] = result["error"]
+            else:
+                notes = result["notes"]
+                notes["file_id"] = file_id
+                chunks.append(notes)
+                entry.update(tempo=result["tempo"], key=result["key"], note_count=len(notes))
+            files[path] = entry
+
+        self.notes = np.concatenate(chunks)
+        self.save()
+
+    def save(self):
+        tmp_path = self.notes_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.notes)
+        os.replace(tmp_path, self.notes_path)
+
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+        self.notes = np.load(self.notes_path, mmap_mode="r")
+
+    def parsed(self, paths):
+        """The given paths that are stored without a parse error"""
+        files = self.index["files"]
+        return [path for path in paths if path in files and "error" not in files[path]]
+
+    def select(self, paths):
+        """Notes of the given files, plus tempo and key arrays indexed by file_id.
+
+        Files outside the selection (and unknown values) are NaN / NO_KEY.
+        """
+        entries = [self.index["files"][path] for path in self.parsed(paths)]
+        ids = [entry["id"] for entry in entries]
+
+        tempos = np.full(self.index["next_id"], np.nan)
+        keys = np.full(self.index["next_id"], NO_KEY)
+        for entry in entries:
+            if entry["tempo"] is not None:
+                tempos[entry["id"]] = entry["tempo"]
+            if entry["key"] is not None:
+                keys[entry["id"]] = entry["key"]
+
+        notes = self.notes[np.isin(self.notes["file_id"], ids)]
+        return notes, tempos, keys
+
+def interval_histogram(notes):
+    """Counts of melodic intervals (-MAX_INTERVAL..+MAX_INTERVAL) between consecutive onsets in each file"""
+    order = np.lexsort((notes["start"], notes["file_id"]))
+    pitch = notes["pitch"][order].astype(np.int16)
+    same_file = notes["file_id"][order][1:] == notes["file_id"][order][:-1]
+    intervals = np.clip(np.diff(pitch)[same_file], -MAX_INTERVAL, MAX_INTERVAL)
+    return np.bincount(intervals + MAX_INTERVAL, minlength=2 * MAX_INTERVAL + 1)
+
+def onset_grid(notes, tempos):
+    """Onset counts per sixteenth-note position in the bar, using each file's tempo (120 if unknown)"""
+    qpm = np.nan_to_num(tempos[notes["file_id"]], nan=120.0)
+    step = 60.0 / qpm / 4
+    positions = np.rint(notes["start"] / step).astype(np.int64) % GRID_STEPS
+    return np.bincount(positions, minlength=GRID_STEPS)
+
+def pitch_class_histograms(notes, file_count):
+    """Duration-weighted 12-bin pitch-class histogram per file_id, as (file_count, 12)"""
+    bins = notes["file_id"].astype(np.int64) * 12 + notes["pitch"] % 12
+    weights = (notes["end"] - notes["start"]).astype(np.float64)
+    return np.bincount(bins, weights=weights, minlength=file_count * 12).reshape(file_count, 12)
+
+def pitch_class_profiles(notes, keys):
+    """Normalized 12-bin pitch-class profile per key signature (rows for keys with no notes are zero)"""
+    note_keys = keys[notes["file_id"]]
+    known = note_keys != NO_KEY
+    bins = note_keys[known] * 12 + notes["pitch"][known] % 12
+    counts = np.bincount(bins, minlength=144).reshape(12, 12).astype(np.float64)
+    totals = counts.sum(axis=1, keepdims=True)
+    return np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
@@ -0,0 +1,209 @@
+"""
+Decoded Audio Cache for Music Assistant
+Mono float32 PCM, stored as .npy files keyed by content hash and read back
+memory-mapped, so re-running an analyzer costs the DSP but not the decode.
+Files keep their native rate up to MAX_SAMPLE_RATE and are downsampled above
+it. The cache is capped at DEFAULT_MAX_BYTES (4 GB, about a hundred
+four-minute tracks at 44.1 kHz) unless given another size.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import numpy as np
+import librosa
+from analysis_cache import content_hash
+from profiling import stage
+
+# Higher-rate files (48/96 kHz) are cached at this rate; lower rates are never upsampled
+MAX_SAMPLE_RATE = 44100
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+class PCMCache:
+    """Directory of <content hash>-<sample rate>.npy files, least recently used evicted past max_bytes.
+
+    Entries are written atomically, so pool workers (and separate scans) can
+    share one directory; an entry evicted while mapped stays readable.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_sample_rate=MAX_SAMPLE_RATE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_sample_rate = max_sample_rate
+        os.makedirs(directory, exist_ok=True)
+
+    def version(self, analyzer_version):
+        """analyzer_version for results computed from this cache's audio (which may be downsampled)"""
+        return f"{analyzer_version}+pcm{self.max_sample_rate}"
+
+    def sample_rate(self, file_path):
+        """Rate the file is cached at"""
+        return min(librosa.get_samplerate(file_path), self.max_sample_rate)
+
+    def path(self, key, sr):
+        return os.path.join(self.directory, f"{key}-{sr}.npy")
+
+    def get(self, key, sr):
+        """Memory-mapped audio for a content hash, or None; a hit becomes the most recently used entry"""
+        path = self.path(key, sr)
+        try:
+            y = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return np.asarray(y)
+
+    def put(self, key, sr, y):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(y, dtype=np.float32))
+            os.replace(tmp_path, self.path(key, sr))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def lookup(self, file_path):
+        """(y, sr) of the file's cached audio, or None, without decoding it"""
+        with stage("pcm_cache"):
+            sr = self.sample_rate(file_path)
+            y = self.get(content_hash(file_path), sr)
+        return (y, sr) if y is not None else None
+
+    def load(self, file_path):
+        """(y, sr) of the file's audio, decoded and cached on a miss"""
+        with stage("pcm_cache"):
+            sr = self.sample_rate(file_path)
+            key = content_hash(file_path)
+            y = self.get(key, sr)
+        if y is not None:
+            return y, sr
+        with stage("load"):
+            y, sr = librosa.load(file_path, sr=sr, mono=True)
+        with stage("pcm_cache"):
+            self.put(key, sr, y)
+        return y, sr
+
+    def stream(self, file_path, block_length, frame_length, hop_length):
+        """(sr, blocks) like librosa.stream(..., mono=True, fill_value=None), read from the cache when possible.
+
+        On a miss the file is streamed from disk at its native rate, and
+        cached on the way unless it is above max_sample_rate (downsampling
+        would need the whole file in memory, which is what streaming avoids).
+        """
+        with stage("pcm_cache"):
+            sr = self.sample_rate(file_path)
+            key = content_hash(file_path)
+            y = self.get(key, sr)
+        if y is not None:
+            return sr, frame_blocks(y, block_length, frame_length, hop_length)
+
+        native = librosa.get_samplerate(file_path)
+        blocks = librosa.stream(file_path, block_length=block_length, frame_length=frame_length,
+                                hop_length=hop_length, mono=True, fill_value=None)
+        if native == sr:
+            blocks = self._store_blocks(key, sr, blocks, block_length * hop_length)
+        return native, blocks
+
+    def _store_blocks(self, key, sr, blocks, step):
+        """Pass blocks through while writing the audio they cover; consecutive blocks start step samples apart"""
+        fd, raw_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw:
+                previous = None
+                for block in blocks:
+                    if previous is not None:
+                        raw.write(previous[:step].astype(np.float32).tobytes())
+                    previous = block
+                    yield block
+                if previous is not None:
+                    raw.write(previous.astype(np.float32).tobytes())
+            self._store_raw(key, sr, raw_path)
+        finally:
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+
+    def _store_raw(self, key, sr, raw_path):
+        """Turn a file of raw float32 samples into a cache entry"""
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)), "fortran_order": False,
+                  "shape": (os.path.getsize(raw_path) // 4,)}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out, open(raw_path, "rb") as raw:
+                np.lib.format.write_array_header_1_0(out, header)
+                shutil.copyfileobj(raw, out)
+            os.replace(tmp_path, self.path(key, sr))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def entries(self):
+        """(last used, bytes, path) of every entry"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".npy"):
+                continue
+            try:
+                info = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((info.st_mtime, info.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes; returns how many"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Another process evicted it first
+            total -= size
+            evicted += 1
+        return evicted
+
+    def usage(self):
+        entries = self.entries()
+        return {"directory": self.directory, "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes,
+                "max_sample_rate": self.max_sample_rate}
+
+def frame_blocks(y, block_length, frame_length, hop_length):
+    """Blocks of block_length frames over y, overlapping by frame_length - hop_length samples"""
+    step = block_length * hop_length
+    span = (block_length - 1) * hop_length + frame_length
+    for start in range(0, len(y), step):
+        yield y[start:start + span]
+        if start + span >= len(y):
+            break
+
+def main():
+    if len(sys.argv) < 3:
+        print(json.dumps({"error": "Usage: pcm_cache.py stats|evict|clear DIR [MAX_GB]"}))
+        return
+
+    command, directory = sys.argv[1], sys.argv[2]
+    max_bytes = int(float(sys.argv[3]) * 1024 ** 3) if len(sys.argv) > 3 else DEFAULT_MAX_BYTES
+    cache = PCMCache(directory, max_bytes)
+
+    if command == "stats":
+        print(json.dumps(cache.usage()))
+    elif command == "evict":
+        print(json.dumps({"evicted": cache.evict(), **cache.usage()}))
+    elif command == "clear":
+        for _, _, path in cache.entries():
+            os.remove(path)
+        print(json.dumps({"success": True, **cache.usage()}))
+    else:
+        print(json.dumps({"error": f"Unknown command: {command}"}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Profiling for Music Assistant
+Opt-in per-stage wall time, CPU time and RSS deltas for one file or request,
+and p50/p95 summaries over many of them
+"""
+
+import sys
+import json
+import math
+import time
+import threading
+import contextlib
+from bench_utils import current_rss_mb
+
+# The profile being recorded on each thread; stage() is a no-op without one
+_local = threading.local()
+_disabled = contextlib.nullcontext()
+
+class Profile:
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Add the wall time, CPU time and RSS change of the block to the named stage.
+
+        CPU time is the whole process's, so it includes library threads (FFT,
+        BLAS, torch) but also other requests served by the same process.
+        """
+        wall, cpu, rss = time.perf_counter(), time.process_time(), current_rss_mb()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, {"wall_ms": 0.0, "cpu_ms": 0.0, "rss_delta_mb": 0.0, "calls": 0})
+            totals["wall_ms"] += (time.perf_counter() - wall) * 1000
+            totals["cpu_ms"] += (time.process_time() - cpu) * 1000
+            totals["rss_delta_mb"] += current_rss_mb() - rss
+            totals["calls"] += 1
+
+    def report(self):
+        """{stage: {"wall_ms", "cpu_ms", "rss_delta_mb", "calls"}}; nested stages are included in their parent's time"""
+        return {name: {"wall_ms": round(totals["wall_ms"], 2), "cpu_ms": round(totals["cpu_ms"], 2),
+                       "rss_delta_mb": round(totals["rss_delta_mb"], 2), "calls": totals["calls"]}
+                for name, totals in self.stages.items()}
+
+@contextlib.contextmanager
+def profiled(enabled=True):
+    """Record the stages run on this thread inside the block; yields the Profile (None when disabled).
+
+    The whole block is recorded as the "total" stage.
+    """
+    if not enabled:
+        yield None
+        return
+    previous = getattr(_local, "profile", None)
+    profile = _local.profile = Profile()
+    try:
+        with profile.stage("total"):
+            yield profile
+    finally:
+        _local.profile = previous
+
+def stage(name):
+    """Context manager timing a stage into the current thread's profile, if one is being recorded"""
+    profile = getattr(_local, "profile", None)
+    return profile.stage(name) if profile is not None else _disabled
+
+def timed_iter(name, iterable):
+    """Yield from iterable, timing each step (e.g. decoding the next block) as the named stage"""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def summarize(reports):
+    """Per-stage p50/p95 over profile reports, slowest total stage first"""
+    samples = {}
+    for report in reports:
+        for name, totals in report.items():
+            samples.setdefault(name, []).append(totals)
+
+    summary = {}
+    for name, values in sorted(samples.items(), key=lambda item: -sum(v["wall_ms"] for v in item[1])):
+        walls = [v["wall_ms"] for v in values]
+        cpus = [v["cpu_ms"] for v in values]
+        rss = [v["rss_delta_mb"] for v in values]
+        summary[name] = {
+            "count": len(values),
+            "wall_ms_total": round(sum(walls), 1),
+            "wall_ms_p50": percentile(walls, 50),
+            "wall_ms_p95": percentile(walls, 95),
+            "cpu_ms_p50": percentile(cpus, 50),
+            "cpu_ms_p95": percentile(cpus, 95),
+            "rss_delta_mb_p95": percentile(rss, 95)
+        }
+    return summary
+
+def read_reports(paths):
+    """Profile reports from NDJSON results or trace files (or stdin for '-')"""
+    for path in paths:
+        stream = sys.stdin if path == "-" else open(path, "r")
+        try:
+            for line in stream:
+                line = line.strip()
+                if not line:
+                    continue
+                records = json.loads(line)
+                for record in records if isinstance(records, list) else [records]:
+                    if isinstance(record, dict) and record.get("profile"):
+                        yield record["profile"]
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "summary":
+        print(json.dumps({"error": "Usage: profiling.py summary [FILE ...]"}))
+        return
+
+    reports = list(read_reports(sys.argv[2:] or ["-"]))
+    if not reports:
+        print(json.dumps({"error": "No profiles found"}))
+        return
+    print(json.dumps({"profiled": len(reports), "stages": summarize(reports)}, indent=2))
+
+if __name__ == "__main__":
+    main()
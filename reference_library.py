@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Reference Library for Music Assistant
+Time-resolved band and loudness profiles of reference tracks, computed once
+and stored, and a vectorized comparison of many mixes against many references
+"""
+
+import os
+import json
+import sqlite3
+import argparse
+import numpy as np
+import librosa
+from analysis_cache import DEFAULT_DB, content_hash, analyzer_version
+from feature_extractor import N_FFT, HOP_LENGTH, BLOCK_LENGTH, WINDOW_RMS
+from profiling import stage, timed_iter
+
+# (name, low Hz, high Hz)
+BANDS = (
+    ("sub", 20, 60),
+    ("bass", 60, 250),
+    ("low-mid", 250, 500),
+    ("mid", 500, 2000),
+    ("upper-mid", 2000, 4000),
+    ("presence", 4000, 6000),
+    ("air", 6000, 20000),
+)
+BAND_NAMES = [name for name, _, _ in BANDS]
+
+# Profiles cover SECTIONS equal slices of a track, so tracks of any length line up
+SECTIONS = 8
+
+# Levels are dBFS mean square, floored here; sections quieter than SILENCE_DB
+# (on either side of a comparison) are left out of it
+FLOOR_DB = -120.0
+SILENCE_DB = -60.0
+
+# Advice thresholds: track-wide band balance and loudness, and a section's
+# departure from the track-wide difference
+BAND_TOLERANCE_DB = 2.0
+LOUDNESS_TOLERANCE_DB = 1.0
+SECTION_TOLERANCE_DB = 3.0
+
+PROFILE_VERSION = analyzer_version("reference_library", 1, __file__)
+
+def band_masks(sr):
+    """(bands, bins) boolean masks over the STFT bins"""
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=N_FFT)
+    return np.array([(freqs >= low) & (freqs < high) for _, low, high in BANDS])
+
+def frame_levels(y, masks):
+    """Mean-square signal power of each frame per band, plus in total: (frames, bands + 1)"""
+    with stage("stft"):
+        power = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH, center=False)) ** 2
+    # Parseval: one-sided bin power back to the windowed frame's mean square
+    power *= 2 / (N_FFT * N_FFT * WINDOW_RMS ** 2)
+    return np.vstack([masks.astype(power.dtype) @ power, power.sum(axis=0)]).T
+
+def compute_profile(file_path, pcm_cache=None):
+    """{"duration", "levels"}: levels is (SECTIONS, bands + 1) dB, the last column the section loudness.
+
+    Reads the file block-wise, so memory is bounded by the block size.
+    """
+    if pcm_cache is not None:
+        sr, blocks = pcm_cache.stream(file_path, BLOCK_LENGTH, N_FFT, HOP_LENGTH)
+    else:
+        sr = librosa.get_samplerate(file_path)
+        blocks = librosa.stream(file_path, block_length=BLOCK_LENGTH, frame_length=N_FFT,
+                                hop_length=HOP_LENGTH, mono=True, fill_value=None)
+    masks = band_masks(sr)
+    frames = np.concatenate([frame_levels(y, masks) for y in timed_iter("load", blocks) if len(y) >= N_FFT]
+                            or [np.empty((0, len(BANDS) + 1))])
+    if len(frames) < SECTIONS:
+        raise ValueError(f"Too short to profile: {file_path}")
+
+    with stage("profile"):
+        bounds = np.linspace(0, len(frames), SECTIONS + 1).astype(int)
+        sections = np.add.reduceat(frames, bounds[:-1], axis=0) / np.diff(bounds)[:, None]
+        levels = np.maximum(10 * np.log10(np.maximum(sections, 1e-30)), FLOOR_DB)
+    return {"duration": len(frames) * HOP_LENGTH / sr, "levels": levels.astype(np.float32)}
+
+class ReferenceLibrary:
+    """Profiles keyed by content hash and profile version; references are the ones with a name"""
+
+    def __init__(self, db_path=DEFAULT_DB, pcm_cache=None):
+        self.db_path = db_path
+        self.pcm_cache = pcm_cache
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS mix_profiles (
+                content_hash TEXT,
+                profile_version TEXT,
+                name TEXT,
+                file_path TEXT,
+                duration REAL,
+                levels BLOB,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (content_hash, profile_version)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_mix_profiles_name ON mix_profiles (name)")
+        self.conn.commit()
+
+    def profile(self, file_path, name=None):
+        """The file's profile, computed and stored on first use; with name it becomes (or stays) a reference"""
+        digest = content_hash(file_path)
+        row = self.conn.execute(
+            "SELECT * FROM mix_profiles WHERE content_hash = ? AND profile_version = ?",
+            (digest, PROFILE_VERSION)
+        ).fetchone()
+        if row is not None:
+            if name and row["name"] != name:
+                with self.conn:
+                    self.conn.execute("UPDATE mix_profiles SET name = NULL WHERE name = ?", (name,))
+                    self.conn.execute(
+                        "UPDATE mix_profiles SET name = ? WHERE content_hash = ? AND profile_version = ?",
+                        (name, digest, PROFILE_VERSION)
+                    )
+            return dict(row_to_profile(row), name=name or row["name"], file=file_path)
+
+        computed = compute_profile(file_path, self.pcm_cache)
+        with self.conn:
+            if name:
+                self.conn.execute("UPDATE mix_profiles SET name = NULL WHERE name = ?", (name,))
+            # Profiles of this content from older versions are superseded
+            self.conn.execute("DELETE FROM mix_profiles WHERE content_hash = ?", (digest,))
+            self.conn.execute(
+                "INSERT INTO mix_profiles (content_hash, profile_version, name, file_path, duration, levels) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, PROFILE_VERSION, name, os.path.abspath(file_path), computed["duration"],
+                 computed["levels"].tobytes())
+            )
+        return dict(computed, name=name, file=file_path)
+
+    def reference(self, name):
+        """A stored reference's profile, recomputed from its file if the profile code changed since"""
+        row = self.conn.execute("SELECT * FROM mix_profiles WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(f"No reference named {name}")
+        if row["profile_version"] != PROFILE_VERSION:
+            return self.profile(row["file_path"], name)
+        return dict(row_to_profile(row), name=name, file=row["file_path"])
+
+    def resolve(self, reference):
+        """Profile for a reference name, or for an audio file path"""
+        if os.path.exists(reference):
+            return self.profile(reference)
+        return self.reference(reference)
+
+    def add(self, file_path, name=None):
+        return self.profile(file_path, name or os.path.splitext(os.path.basename(file_path))[0])
+
+    def remove(self, name):
+        """Drop a name from the library (the profile stays cached); False if there was none"""
+        with self.conn:
+            cursor = self.conn.execute("UPDATE mix_profiles SET name = NULL WHERE name = ?", (name,))
+        return cursor.rowcount > 0
+
+    def references(self):
+        return [{"name": row["name"], "file": row["file_path"], "duration": round(row["duration"], 1),
+                 "created_at": row["created_at"]}
+                for row in self.conn.execute(
+                    "SELECT name, file_path, duration, created_at FROM mix_profiles "
+                    "WHERE name IS NOT NULL ORDER BY name")]
+
+    def close(self):
+        self.conn.close()
+
+def row_to_profile(row):
+    levels = np.frombuffer(row["levels"], dtype=np.float32).reshape(SECTIONS, len(BANDS) + 1)
+    return {"duration": row["duration"], "levels": levels}
+
+def compare_profiles(mixes, references):
+    """Every mix against every reference in one broadcast pass; arrays are indexed [mix, reference, ...].
+
+    "balance" is each band's level relative to the section loudness, mix
+    minus reference, per section; "loudness" the section loudness
+    difference. "bands" and "loudness_db" are their means over the sections
+    that are not silent on either side, and "distance" is the RMS of the
+    balance differences over those sections.
+    """
+    mix = np.stack([profile["levels"] for profile in mixes])[:, None]
+    ref = np.stack([profile["levels"] for profile in references])[None]
+    valid = (mix[..., -1] > SILENCE_DB) & (ref[..., -1] > SILENCE_DB)
+    weights = valid / np.maximum(valid.sum(axis=2, keepdims=True), 1)
+
+    loudness = mix[..., -1] - ref[..., -1]
+    balance = (mix[..., :-1] - mix[..., -1:]) - (ref[..., :-1] - ref[..., -1:])
+    return {
+        "valid": valid,
+        "balance": balance,
+        "loudness": loudness,
+        "bands": np.einsum("mrs,mrsb->mrb", weights, balance),
+        "loudness_db": (weights * loudness).sum(axis=2),
+        "distance": np.sqrt(np.einsum("mrs,mrsb->mr", weights, balance ** 2) / len(BANDS)),
+    }
+
+def hz(frequency):
+    return f"{frequency / 1000:g} kHz" if frequency >= 1000 else f"{frequency} Hz"
+
+def band_range(index):
+    _, low, high = BANDS[index]
+    return f"{hz(low)}-{hz(high)}"
+
+def band_advice(index, diff, where="overall"):
+    direction, action = ("above", "cut") if diff > 0 else ("below", "boost")
+    return (f"{BAND_NAMES[index].capitalize()} sits {abs(diff):.1f} dB {direction} the reference {where} "
+            f"({action} around {band_range(index)}).")
+
+def loudness_advice(diff, where=""):
+    if diff > 0:
+        return f"Your mix is {diff:.1f} dB louder than the reference{where} (reduce gain/limiting)."
+    return f"Your mix is {-diff:.1f} dB quieter than the reference{where} (add gain/limiting)."
+
+def comparison_report(diffs, m, r, duration):
+    """Per-band and per-section advice for one mix/reference pair of compare_profiles output"""
+    bands, loudness_db = diffs["bands"][m, r], float(diffs["loudness_db"][m, r])
+    advice = [band_advice(b, bands[b]) for b in np.argsort(-np.abs(bands))
+              if abs(bands[b]) > BAND_TOLERANCE_DB]
+    if abs(loudness_db) > LOUDNESS_TOLERANCE_DB:
+        advice.append(loudness_advice(loudness_db))
+
+    # Sections are judged against the track-wide difference, so one overall offset isn't repeated per section
+    band_departure = diffs["balance"][m, r] - bands
+    loudness_departure = diffs["loudness"][m, r] - loudness_db
+    sections = []
+    for s in range(SECTIONS):
+        if not diffs["valid"][m, r, s]:
+            continue
+        section_advice = []
+        if abs(loudness_departure[s]) > SECTION_TOLERANCE_DB:
+            section_advice.append(loudness_advice(loudness_departure[s], " here, beyond the overall difference"))
+        section_advice += [band_advice(b, band_departure[s, b], "here")
+                           for b in np.argsort(-np.abs(band_departure[s]))
+                           if abs(band_departure[s, b]) > SECTION_TOLERANCE_DB]
+        sections.append({
+            "section": s,
+            "start": round(duration * s / SECTIONS, 1),
+            "end": round(duration * (s + 1) / SECTIONS, 1),
+            "loudness_db": round(float(diffs["loudness"][m, r, s]), 2),
+            "bands": {BAND_NAMES[b]: round(float(diffs["balance"][m, r, s, b]), 2) for b in range(len(BANDS))},
+            "advice": section_advice
+        })
+
+    return {
+        "distance_db": round(float(diffs["distance"][m, r]), 2),
+        "loudness_db": round(loudness_db, 2),
+        "bands": {BAND_NAMES[b]: round(float(bands[b]), 2) for b in range(len(BANDS))},
+        "advice": advice,
+        "sections": sections
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage stored reference-track profiles for mix matching")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Database holding the profiles")
+    commands = parser.add_subparsers(dest="command")
+
+    add_parser = commands.add_parser("add", help="Profile a reference track and store it under a name")
+    add_parser.add_argument("file")
+    add_parser.add_argument("--name", help="Defaults to the file name")
+    add_parser.add_argument("--pcm-cache", metavar="DIR", help="Read decoded audio through this PCM cache")
+
+    commands.add_parser("list", help="Stored references")
+
+    remove_parser = commands.add_parser("remove", help="Drop a reference")
+    remove_parser.add_argument("name")
+
+    args = parser.parse_args()
+    if args.command is None:
+        print(json.dumps({"error": "No command provided"}))
+        return
+
+    pcm_cache = None
+    if getattr(args, "pcm_cache", None):
+        from pcm_cache import PCMCache
+
+        pcm_cache = PCMCache(args.pcm_cache)
+    library = ReferenceLibrary(args.db, pcm_cache)
+    try:
+        if args.command == "add":
+            profile = library.add(args.file, args.name)
+            print(json.dumps({"success": True, "name": profile["name"], "duration": round(profile["duration"], 1)}))
+        elif args.command == "list":
+            print(json.dumps({"references": library.references()}))
+        elif not library.remove(args.name):
+            print(json.dumps({"error": f"No reference named {args.name}"}))
+        else:
+            print(json.dumps({"success": True}))
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(json.dumps({"error": str(e)}))
+    finally:
+        library.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Response Cache for Music Assistant
+On-disk LRU cache of local AI replies, keyed by the normalized prompt plus
+the generation parameters
+"""
+
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+DEFAULT_PATH = "response_cache.db"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+def normalize_prompt(prompt):
+    """Collapse whitespace and case so trivially different asks share an entry"""
+    return " ".join(prompt.split()).casefold()
+
+def cache_key(prompt, params):
+    payload = json.dumps({"prompt": normalize_prompt(prompt), "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def is_cacheable(params, requested=None):
+    """Greedy decodes are cached unless asked not to; sampled ones only when asked"""
+    if requested is not None:
+        return bool(requested)
+    return not params.get("do_sample", True)
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                prompt TEXT,
+                params TEXT,
+                response TEXT,
+                size INTEGER,
+                last_used REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+        self.conn.commit()
+
+    def get(self, prompt, params):
+        """Cached reply or None; a hit becomes the most recently used entry"""
+        key = cache_key(prompt, params)
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, prompt, params, response, evict=True):
+        size = len(prompt.encode()) + len(response.encode())
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, prompt, params, response, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key(prompt, params), prompt, json.dumps(params, sort_keys=True),
+                 response, size, time.time())
+            )
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the store fits max_bytes"""
+        with self.lock, self.conn:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            doomed = []
+            for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                if total <= self.max_bytes:
+                    break
+                doomed.append((key,))
+                total -= size
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        return len(doomed)
+
+    def warm_from_sessions(self, db_path, params):
+        """Seed the cache with prompt/content pairs recorded in creative_sessions"""
+        source = sqlite3.connect(db_path)
+        try:
+            rows = source.execute(
+                "SELECT prompt, generated_content FROM creative_sessions "
+                "WHERE prompt IS NOT NULL AND generated_content IS NOT NULL ORDER BY created_at"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        finally:
+            source.close()
+
+        for prompt, content in rows:
+            self.put(prompt, params, content, evict=False)
+        self.evict()
+        return len(rows)
+
+    def stats(self):
+        with self.lock:
+            count, total = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,151 @@
+"""
+Scan Jobs for Music Assistant
+Persistent state for long analyze_audio.py scans: which files are pending,
+done or failed, checkpointed as results arrive so a killed scan can resume
+"""
+
+import json
+import time
+import sqlite3
+from analysis_cache import DEFAULT_DB
+
+# Failed files are retried until they have failed this many times
+MAX_ATTEMPTS = 3
+
+# Finished files are committed in batches: every CHECKPOINT_SIZE results or
+# CHECKPOINT_INTERVAL seconds, so a crash loses at most that much work
+CHECKPOINT_SIZE = 100
+CHECKPOINT_INTERVAL = 1.0
+
+class ScanJobs:
+    def __init__(self, db_path=DEFAULT_DB, checkpoint_size=CHECKPOINT_SIZE,
+                 checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.db_path = db_path
+        self.checkpoint_size = checkpoint_size
+        self.checkpoint_interval = checkpoint_interval
+        self.pending_updates = []
+        self.last_checkpoint = time.time()
+        # Called before outcomes are committed, e.g. to flush the results they refer to first
+        self.before_checkpoint = None
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS scan_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT DEFAULT 'running',
+                options TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS scan_job_files (
+                job_id INTEGER,
+                path TEXT,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                error TEXT,
+                result TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job_id, path),
+                FOREIGN KEY (job_id) REFERENCES scan_jobs (id)
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_scan_job_files_status ON scan_job_files (job_id, status)"
+        )
+        self.conn.commit()
+
+    def create(self, files, options=None):
+        """Register a new job with every file pending; returns the job id"""
+        with self.conn:
+            job_id = self.conn.execute(
+                "INSERT INTO scan_jobs (options) VALUES (?)", (json.dumps(options or {}),)
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO scan_job_files (job_id, path) VALUES (?, ?)",
+                ((job_id, path) for path in files)
+            )
+        return job_id
+
+    def options(self, job_id):
+        row = self.conn.execute("SELECT options FROM scan_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No scan job {job_id}")
+        return json.loads(row[0] or "{}")
+
+    def remaining(self, job_id, max_attempts=MAX_ATTEMPTS):
+        """Paths still to analyze: pending, or failed fewer than max_attempts times"""
+        return [row[0] for row in self.conn.execute(
+            "SELECT path FROM scan_job_files WHERE job_id = ? "
+            "AND (status = 'pending' OR (status = 'failed' AND attempts < ?)) ORDER BY rowid",
+            (job_id, max_attempts)
+        )]
+
+    def record(self, job_id, result):
+        """Queue a finished file's outcome; checkpoints when the batch is full or old enough"""
+        if "error" in result:
+            self.pending_updates.append(("failed", result["error"], None, job_id, result["file"]))
+        else:
+            self.pending_updates.append(("done", None, json.dumps(result), job_id, result["file"]))
+        if (len(self.pending_updates) >= self.checkpoint_size
+                or time.time() - self.last_checkpoint >= self.checkpoint_interval):
+            self.checkpoint()
+
+    def checkpoint(self):
+        updates, self.pending_updates = self.pending_updates, []
+        self.last_checkpoint = time.time()
+        if not updates:
+            return
+        if self.before_checkpoint is not None:
+            self.before_checkpoint()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE scan_job_files SET status = ?, error = ?, result = ?, attempts = attempts + 1, "
+                "updated_at = CURRENT_TIMESTAMP WHERE job_id = ? AND path = ?",
+                updates
+            )
+
+    def finish(self, job_id, max_attempts=MAX_ATTEMPTS):
+        """Checkpoint and mark the job done once nothing is left to retry"""
+        self.checkpoint()
+        status = "running" if self.remaining(job_id, max_attempts) else "done"
+        with self.conn:
+            self.conn.execute(
+                "UPDATE scan_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (status, job_id)
+            )
+        return status
+
+    def summary(self, job_id):
+        row = self.conn.execute("SELECT status FROM scan_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No scan job {job_id}")
+        counts = dict(self.conn.execute(
+            "SELECT status, COUNT(*) FROM scan_job_files WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall())
+        failed = [{"file": path, "error": error, "attempts": attempts} for path, error, attempts in
+                  self.conn.execute(
+                      "SELECT path, error, attempts FROM scan_job_files "
+                      "WHERE job_id = ? AND status = 'failed' ORDER BY rowid", (job_id,)
+                  )]
+        return {
+            "job_id": job_id,
+            "status": row[0],
+            "pending": counts.get("pending", 0),
+            "done": counts.get("done", 0),
+            "failed": failed
+        }
+
+    def results(self, job_id):
+        """Stored results of the job's finished files"""
+        for (result,) in self.conn.execute(
+            "SELECT result FROM scan_job_files WHERE job_id = ? AND status = 'done' ORDER BY rowid",
+            (job_id,)
+        ):
+            yield json.loads(result)
+
+    def close(self):
+        self.checkpoint()
+        self.conn.close()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Job Scheduler for Music Assistant
+Local daemon that every heavy Python workload takes a lease from: interactive
+work (chat, MIDI generation, mix matching) goes first, and background work
+(library scans, style training) waits between files while it runs. Workloads
+run unscheduled when no scheduler is listening.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import multiprocessing
+import argparse
+import threading
+import contextlib
+import statistics
+import itertools
+import json_ipc
+
+SERVICE_NAME = "scheduler"
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Priority class and concurrency cap of each workload
+WORKLOADS = {
+    "chat": (INTERACTIVE, 1),
+    "generate": (INTERACTIVE, 1),
+    "mix-match": (INTERACTIVE, 2),
+    "scan": (BACKGROUND, 1),
+    "train": (BACKGROUND, 1),
+}
+
+# Background leases may use this many CPUs in total (a lone lease is always let through)
+BACKGROUND_CPUS = os.cpu_count() or 1
+
+# Background processes run at this niceness so they yield the CPU even between checkpoints
+BACKGROUND_NICE = 10
+
+# How often leases of processes that exited without releasing are reclaimed
+REAP_INTERVAL = 2.0
+
+# Wait/run times kept per workload for the stats percentiles
+LATENCY_WINDOW = 200
+
+class Lease:
+    def __init__(self, lease_id, request):
+        self.id = lease_id
+        self.workload = request["workload"]
+        self.priority = WORKLOADS[self.workload][0]
+        self.owner = request.get("pid")
+        self.pids = request.get("pids") or ([self.owner] if self.owner else [])
+        self.cpus = max(1, int(request.get("cpus", 1)))
+        self.requested_at = time.time()
+        self.granted_at = None
+        self.cancelled = False
+
+    @property
+    def order(self):
+        return (self.priority, self.requested_at)
+
+class Scheduler:
+    def __init__(self, background_cpus=BACKGROUND_CPUS, keep_running=0):
+        self.background_cpus = background_cpus
+        self.keep_running = keep_running
+        self.condition = threading.Condition()
+        self.stop = threading.Event()
+        self.ids = itertools.count(1)
+        self.waiting = []
+        self.running = {}
+        self.passing = set()  # Background pids let past checkpoints during interactive work (keep_running)
+        self.held = 0  # Background workers currently waiting at a checkpoint
+        self.latencies = {name: {"wait": [], "run": []} for name in WORKLOADS}
+        self.stats = {"granted": 0, "released": 0, "reaped": 0, "pauses": 0}
+
+    def handle(self, request):
+        command = request.get("cmd", "acquire")
+
+        if command == "ping":
+            yield {"ok": True}
+        elif command == "stats":
+            yield self.snapshot()
+        elif command == "acquire":
+            yield self.acquire(request)
+        elif command == "release":
+            yield self.release(request.get("lease"))
+        elif command == "checkpoint":
+            yield self.checkpoint(request)
+        elif command == "shutdown":
+            self.stop.set()
+            yield {"ok": True}
+        else:
+            yield {"error": f"Unknown command: {command}"}
+
+    def acquire(self, request):
+        """Block until the workload may run; returns {"lease": id} (or an error on timeout)"""
+        if request.get("workload") not in WORKLOADS:
+            return {"error": f"Unknown workload: {request.get('workload')}"}
+        timeout = request.get("timeout")
+        with self.condition:
+            lease = Lease(next(self.ids), request)
+            self.waiting.append(lease)
+            self.schedule()
+            granted = self.condition.wait_for(
+                lambda: lease.granted_at is not None or lease.cancelled or self.stop.is_set(), timeout)
+            if lease.granted_at is None:
+                if lease in self.waiting:
+                    self.waiting.remove(lease)
+                return {"error": "Timed out waiting for a slot" if not granted else "Lease request cancelled"}
+        return {"lease": lease.id, "waited_seconds": round(lease.granted_at - lease.requested_at, 3)}
+
+    def release(self, lease_id):
+        with self.condition:
+            lease = self.running.pop(lease_id, None)
+            if lease is None:
+                return {"error": f"No lease {lease_id}"}
+            self.finish(lease)
+            self.stats["released"] += 1
+            self.schedule()
+        return {"ok": True}
+
+    def checkpoint(self, request):
+        """Block a background worker between files while interactive leases run"""
+        pid = request.get("pid")
+        started = time.time()
+        with self.condition:
+            if WORKLOADS.get(request.get("workload"), (BACKGROUND,))[0] == BACKGROUND and not self.may_pass(pid):
+                self.stats["pauses"] += 1
+                self.held += 1
+                try:
+                    self.condition.wait_for(lambda: self.may_pass(pid) or self.stop.is_set())
+                finally:
+                    self.held -= 1
+        return {"ok": True, "waited_seconds": round(time.time() - started, 3)}
+
+    def may_pass(self, pid):
+        """Whether a background pid may start its next file (caller holds the condition)"""
+        if not self.interactive():
+            return True
+        if pid not in self.passing and len(self.passing) < self.keep_running:
+            self.passing.add(pid)
+        return pid in self.passing
+
+    def interactive(self):
+        return any(lease.priority == INTERACTIVE for lease in self.running.values())
+
+    def finish(self, lease):
+        """Bookkeeping for a lease leaving the running set (caller holds the condition)"""
+        samples = self.latencies[lease.workload]["run"]
+        samples.append(time.time() - lease.granted_at)
+        del samples[:-LATENCY_WINDOW]
+
+    def schedule(self):
+        """Grant every waiting lease that fits, highest priority first, and wake waiting checkpoints"""
+        for lease in sorted(self.waiting, key=lambda lease: lease.order):
+            if self.fits(lease):
+                self.waiting.remove(lease)
+                lease.granted_at = time.time()
+                self.running[lease.id] = lease
+                self.stats["granted"] += 1
+                samples = self.latencies[lease.workload]["wait"]
+                samples.append(lease.granted_at - lease.requested_at)
+                del samples[:-LATENCY_WINDOW]
+                if lease.priority == BACKGROUND:
+                    renice(lease.pids)
+        if not self.interactive():
+            self.passing.clear()
+        self.condition.notify_all()
+
+    def fits(self, lease):
+        limit = WORKLOADS[lease.workload][1]
+        if sum(1 for other in self.running.values() if other.workload == lease.workload) >= limit:
+            return False
+        if lease.priority == INTERACTIVE:
+            return True
+        background = [other for other in self.running.values() if other.priority == BACKGROUND]
+        return not background or sum(other.cpus for other in background) + lease.cpus <= self.background_cpus
+
+    def reap(self):
+        """Reclaim leases of owners that exited without releasing them"""
+        while not self.stop.wait(REAP_INTERVAL):
+            with self.condition:
+                dead = [lease for lease in self.running.values() if lease.owner and not alive(lease.owner)]
+                for lease in dead:
+                    del self.running[lease.id]
+                    self.finish(lease)
+                    self.stats["reaped"] += 1
+                for lease in [lease for lease in self.waiting if lease.owner and not alive(lease.owner)]:
+                    self.waiting.remove(lease)
+                    lease.cancelled = True
+                if dead:
+                    self.schedule()
+                self.condition.notify_all()
+        with self.condition:
+            self.condition.notify_all()  # Let waiting checkpoints return on shutdown
+
+    def snapshot(self):
+        """Queue depth, running leases and wait/run latency percentiles per workload"""
+        with self.condition:
+            workloads = {}
+            for name in WORKLOADS:
+                entry = {
+                    "queued": sum(1 for lease in self.waiting if lease.workload == name),
+                    "running": sum(1 for lease in self.running.values() if lease.workload == name)
+                }
+                for kind, samples in self.latencies[name].items():
+                    if samples:
+                        ordered = sorted(samples)
+                        entry[f"{kind}_seconds_p50"] = round(statistics.median(ordered), 3)
+                        entry[f"{kind}_seconds_p95"] = round(ordered[int(0.95 * (len(ordered) - 1))], 3)
+                workloads[name] = entry
+            return dict(self.stats, queued=len(self.waiting), running=len(self.running),
+                        held_workers=self.held, workloads=workloads)
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+def renice(pids):
+    for pid in pids:
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, max(os.getpriority(os.PRIO_PROCESS, pid), BACKGROUND_NICE))
+        except OSError:
+            pass
+
+@contextlib.contextmanager
+def slot(workload, pids=None, cpus=1, timeout=None):
+    """Client: hold a scheduler lease for workload during the block.
+
+    pids are the processes doing the work (default: this one); background ones
+    are reniced. Without a listening scheduler the block just runs.
+    """
+    path = json_ipc.socket_path(SERVICE_NAME)
+    lease = None
+    if json_ipc.is_listening(path):
+        request = {"cmd": "acquire", "workload": workload, "pid": os.getpid(),
+                   "pids": list(pids) if pids else [os.getpid()], "cpus": cpus, "timeout": timeout}
+        try:
+            lease = _call(path, request).get("lease")
+        except OSError:
+            lease = None
+    try:
+        yield lease
+    finally:
+        if lease is not None:
+            try:
+                _call(path, {"cmd": "release", "lease": lease})
+            except OSError:
+                pass
+
+def checkpoint(workload):
+    """Client: call between files of a background workload, outside any transaction.
+
+    Returns once no interactive work is running, so a held worker never sits
+    on a database lock. Returns at once when no scheduler is listening.
+    """
+    try:
+        _call(json_ipc.socket_path(SERVICE_NAME), {"cmd": "checkpoint", "workload": workload, "pid": os.getpid()})
+    except OSError:
+        pass
+
+def worker_pool(processes, initializer=None, initargs=()):
+    """multiprocessing Pool and the pids of its workers, as reported by each worker on startup"""
+    pids = multiprocessing.SimpleQueue()
+    pool = multiprocessing.Pool(processes, initializer=report_pid, initargs=(pids, initializer, initargs))
+    return pool, [pids.get() for _ in range(processes)]
+
+def report_pid(pids, initializer, initargs):
+    pids.put(os.getpid())
+    if initializer is not None:
+        initializer(*initargs)
+
+def _call(path, request):
+    for reply in json_ipc.call(path, request):
+        if reply.get("done"):
+            return reply
+    raise ConnectionError("Scheduler closed the connection")
+
+def stats():
+    """Client: the running scheduler's stats, or None when none is listening"""
+    path = json_ipc.socket_path(SERVICE_NAME)
+    if not json_ipc.is_listening(path):
+        return None
+    return _call(path, {"cmd": "stats"})
+
+def main():
+    parser = argparse.ArgumentParser(description="Prioritize interactive workloads over background scans")
+    parser.add_argument("--socket", default=json_ipc.socket_path(SERVICE_NAME),
+                        help="Unix socket to listen on")
+    parser.add_argument("--background-cpus", type=int, default=BACKGROUND_CPUS,
+                        help="CPUs background leases may use together")
+    parser.add_argument("--keep-running", type=int, default=0, metavar="N",
+                        help="Background processes not held at checkpoints during interactive work")
+    parser.add_argument("--stats", action="store_true", help="Print the running scheduler's stats and exit")
+    args = parser.parse_args()
+
+    if args.stats:
+        print(json.dumps(stats() or {"error": "No scheduler running"}))
+        return
+
+    scheduler = Scheduler(background_cpus=args.background_cpus, keep_running=args.keep_running)
+    signal.signal(signal.SIGTERM, lambda *_: scheduler.stop.set())
+    threading.Thread(target=scheduler.reap, daemon=True).start()
+
+    print(f"🚦 Scheduler listening on {args.socket}")
+    sys.stdout.flush()
+    try:
+        json_ipc.serve_socket(args.socket, scheduler.handle, stop=scheduler.stop)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
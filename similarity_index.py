@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Similarity Index for Music Assistant
+Fixed-length feature vectors for every analyzed sample in one float32 matrix,
+with top-k nearest neighbours by batched matrix products
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import numpy as np
+from analysis_cache import DEFAULT_DB, columns_to_result
+
+DEFAULT_PATH = "similarity_index"  # similarity_index.npy (vectors) + similarity_index.meta.npz
+RELATIONSHIP_TYPE = "audio_similarity"
+DEFAULT_K = 10
+
+# Query rows per matrix product when scoring the whole library
+QUERY_BATCH = 1024
+
+# Columns sampled for each query's top-k score bound (see search)
+BOUND_COLUMNS = 4096
+
+# (field, length) of each feature group in the vector. Each group is scaled
+# to unit weight so the 13 MFCCs don't outvote tempo or loudness.
+FEATURE_GROUPS = [
+    ("chroma", 12),
+    ("mfcc", 13),
+    ("centroid", 1),
+    ("bandwidth", 1),
+    ("tempo", 1),
+    ("rms", 1),
+]
+DIMENSIONS = sum(length for _, length in FEATURE_GROUPS)
+
+def raw_vector(result):
+    """Unscaled feature vector for one analyzer result, or None if it lacks a field"""
+    try:
+        chroma = np.asarray(result["chroma"], dtype=np.float64)
+        parts = [
+            chroma / max(chroma.sum(), 1e-9),
+            result["mfcc"],
+            [np.log(max(result["centroid"], 1.0))],
+            [np.log(max(result["bandwidth"], 1.0))],
+            # log2 so a tempo an octave off is one unit away, whatever the tempo
+            [np.log2(max(result["tempo"], 1.0))],
+            [np.log(max(result["rms"], 1e-6))],
+        ]
+    except (KeyError, TypeError):
+        return None
+    vector = np.concatenate([np.asarray(part, dtype=np.float64) for part in parts])
+    return vector if len(vector) == DIMENSIONS else None
+
+def group_weights():
+    return np.concatenate([np.full(length, 1 / np.sqrt(length)) for _, length in FEATURE_GROUPS])
+
+class SimilarityIndex:
+    def __init__(self, ids, vectors, mean, scale):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = vectors  # unit rows, so dot product is cosine similarity
+        self.mean = mean
+        self.scale = scale
+        self.positions = {sample_id: row for row, sample_id in enumerate(self.ids.tolist())}
+
+    @classmethod
+    def build(cls, ids, raw):
+        """Standardize each dimension over the library, weight the groups and normalize rows"""
+        raw = np.asarray(raw, dtype=np.float64).reshape(-1, DIMENSIONS)
+        mean = raw.mean(axis=0) if len(raw) else np.zeros(DIMENSIONS)
+        std = raw.std(axis=0) if len(raw) else np.ones(DIMENSIONS)
+        scale = group_weights() / np.where(std > 1e-9, std, 1.0)
+        index = cls(ids, np.zeros((0, DIMENSIONS), dtype=np.float32), mean, scale)
+        index.vectors = index.embed(raw)
+        return index
+
+    @classmethod
+    def from_db(cls, db_path=DEFAULT_DB):
+        """Index the newest analyze_audio result of every sample linked to a track"""
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                "SELECT sample_id, tempo_data, harmonic_data, mood_data, spectral_data "
+                "FROM sample_analysis WHERE sample_id IS NOT NULL "
+                "AND (analyzer_version IS NULL OR analyzer_version LIKE 'analyze_audio/%') "
+                "ORDER BY updated_at, id"
+            ).fetchall()
+        finally:
+            conn.close()
+
+        latest = {}
+        for row in rows:
+            vector = raw_vector(columns_to_result(row))
+            if vector is not None:
+                latest[row["sample_id"]] = vector
+        ids = sorted(latest)
+        return cls.build(ids, [latest[sample_id] for sample_id in ids])
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        """Load a saved index; the vectors are memory-mapped"""
+        meta = np.load(path + ".meta.npz")
+        vectors = np.load(path + ".npy", mmap_mode="r")
+        return cls(meta["ids"], vectors, meta["mean"], meta["scale"])
+
+    def save(self, path=DEFAULT_PATH):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        os.replace(tmp_path, path + ".npy")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, ids=self.ids, mean=self.mean, scale=self.scale)
+        os.replace(tmp_path, path + ".meta.npz")
+
+    def embed(self, raw):
+        """Unit float32 rows for raw feature vectors, in this index's space"""
+        vectors = ((np.atleast_2d(raw) - self.mean) * self.scale).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def search(self, queries, k=DEFAULT_K, exclude=None):
+        """Top-k (indices, scores) per query row, best first.
+
+        exclude[i] is a row to leave out of query i's results (its own sample).
+        """
+        k = min(k, len(self.ids) - (exclude is not None))
+        if k <= 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        scores = queries @ self.vectors.T
+        if exclude is not None:
+            scores[np.arange(len(queries)), exclude] = -np.inf
+
+        # The k-th best score among the first BOUND_COLUMNS is a lower bound on
+        # each row's true k-th best, so only the few scores above it get sorted
+        # instead of partitioning every full row
+        columns = max(BOUND_COLUMNS, k + 1)
+        bound = np.partition(scores[:, :columns], -k, axis=1)[:, -k]
+        flat = np.flatnonzero(scores >= bound[:, None])
+        rows, cols = np.divmod(flat, scores.shape[1])
+        values = scores.ravel()[flat]
+        order = np.lexsort((-values, rows))
+        cols, values = cols[order], values[order]
+        pick = np.searchsorted(rows[order], np.arange(len(queries)))[:, None] + np.arange(k)
+        return cols[pick], values[pick]
+
+    def similar(self, sample_id, k=DEFAULT_K):
+        """[(sample_id, score)] nearest to an indexed sample"""
+        row = self.positions[sample_id]
+        top, scores = self.search(self.vectors[row:row + 1], k, exclude=[row])
+        return [(int(self.ids[i]), float(s)) for i, s in zip(top[0], scores[0])]
+
+    def similar_to_result(self, result, k=DEFAULT_K):
+        """[(sample_id, score)] nearest to an analyzer result that may not be indexed"""
+        raw = raw_vector(result)
+        if raw is None:
+            raise ValueError("Result lacks the similarity features (re-run analyze_audio.py)")
+        top, scores = self.search(self.embed(raw), k)
+        return [(int(self.ids[i]), float(s)) for i, s in zip(top[0], scores[0])]
+
+    def all_pairs(self, k=DEFAULT_K, batch=QUERY_BATCH):
+        """Yield (sample1_id, sample2_id, score) for every sample's top-k, QUERY_BATCH rows at a time"""
+        for start in range(0, len(self.ids), batch):
+            rows = np.arange(start, min(start + batch, len(self.ids)))
+            top, scores = self.search(np.asarray(self.vectors[rows]), k, exclude=rows)
+            for row, neighbours, row_scores in zip(rows, top, scores):
+                for neighbour, score in zip(neighbours, row_scores):
+                    yield int(self.ids[row]), int(self.ids[neighbour]), round(float(score), 4)
+
+def write_relationships(index, db_path=DEFAULT_DB, k=DEFAULT_K):
+    """Replace the audio_similarity rows of sample_relationships with each sample's top-k"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sample_relationships (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sample1_id INTEGER,
+                sample2_id INTEGER,
+                relationship_type TEXT,
+                similarity_score REAL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (sample1_id) REFERENCES tracks (id),
+                FOREIGN KEY (sample2_id) REFERENCES tracks (id)
+            )
+        """)
+        with conn:
+            conn.execute("DELETE FROM sample_relationships WHERE relationship_type = ?",
+                         (RELATIONSHIP_TYPE,))
+            cursor = conn.executemany(
+                "INSERT INTO sample_relationships (sample1_id, sample2_id, relationship_type, similarity_score) "
+                "VALUES (?, ?, ?, ?)",
+                ((a, b, RELATIONSHIP_TYPE, score) for a, b, score in index.all_pairs(k))
+            )
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Find similar samples from their analysis features")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--index", default=DEFAULT_PATH, metavar="PATH",
+                        help="Saved index (PATH.npy and PATH.meta.npz)")
+    parser.add_argument("-k", type=int, default=DEFAULT_K, help="Neighbours per sample")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("build", help="Index sample_analysis and write sample_relationships")
+    query = commands.add_parser("similar", help="Nearest samples to an indexed sample id")
+    query.add_argument("sample_id", type=int)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = SimilarityIndex.from_db(args.db)
+        index.save(args.index)
+        pairs = write_relationships(index, args.db, args.k)
+        print(json.dumps({"success": True, "samples": len(index.ids), "relationships": pairs}))
+    elif args.command == "similar":
+        if not os.path.exists(args.index + ".npy"):
+            print(json.dumps({"error": "No similarity index found. Run the build command first."}))
+            return
+        index = SimilarityIndex.load(args.index)
+        if args.sample_id not in index.positions:
+            print(json.dumps({"error": f"Sample {args.sample_id} is not indexed"}))
+            return
+        similar = index.similar(args.sample_id, args.k)
+        print(json.dumps([{"sample_id": i, "similarity_score": s} for i, s in similar]))
+    else:
+        parser.print_help(sys.stderr)
+
+if __name__ == "__main__":
+    main()
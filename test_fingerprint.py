@@ -0,0 +1,72 @@
+"""
+Fingerprint tests for Music Assistant
+Copies that differ only in gain or sample rate must clear REUSE_SIMILARITY
+with room to spare, and near-duplicate lookups must cope with any number of
+LSH candidates. Run with: python -m pytest test_fingerprint.py
+"""
+
+import sqlite3
+import numpy as np
+import pytest
+import fingerprint
+from analysis_cache import AnalysisCache
+
+# Copies must score at least this far above REUSE_SIMILARITY
+MARGIN = 0.1
+
+def synth(sr, seconds=20.0, seed=7):
+    """Decaying tones on a 16th-note grid over a little noise (no exactly tied spectral peaks)"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sr * seconds)) / sr
+    y = np.zeros_like(t)
+    for start in np.arange(0, seconds, 0.25):
+        frequency = 110 * 2 ** (rng.integers(0, 36) / 12)
+        envelope = np.where(t >= start, np.exp(-(t - start) * 6), 0)
+        y += rng.uniform(0.2, 1) * envelope * np.sin(2 * np.pi * frequency * t)
+    y += rng.normal(0, 0.01, len(t))
+    return (0.3 * y / np.abs(y).max()).astype(np.float32)
+
+@pytest.fixture(scope="module")
+def original():
+    y = synth(44100)
+    return y, fingerprint.fingerprint_audio(y, 44100)
+
+@pytest.mark.parametrize("gain", [0.1, 0.5, 2.0])
+def test_gain_change_is_reused(original, gain):
+    y, signature = original
+    copy = fingerprint.fingerprint_audio(y * gain, 44100)
+    assert fingerprint.similarity(signature, copy) >= fingerprint.REUSE_SIMILARITY + MARGIN
+
+@pytest.mark.parametrize("sr", [22050, 32000, 48000])
+def test_resampled_copy_is_reused(original, sr):
+    import librosa
+
+    y, signature = original
+    copy = fingerprint.fingerprint_audio(librosa.resample(y, orig_sr=44100, target_sr=sr), sr)
+    assert fingerprint.similarity(signature, copy) >= fingerprint.REUSE_SIMILARITY + MARGIN
+
+def test_different_material_is_not_reused(original):
+    _, signature = original
+    other = fingerprint.fingerprint_audio(synth(44100, seed=8), 44100)
+    assert fingerprint.similarity(signature, other) < fingerprint.REUSE_SIMILARITY
+
+def test_find_duplicate_with_more_candidates_than_sqlite_variables(tmp_path, original):
+    _, signature = original
+    cache = AnalysisCache(str(tmp_path / "cache.db"))
+    # SQLite's historical default; builds with a higher limit would hide the problem
+    cache.conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    rng = np.random.default_rng(0)
+
+    # Candidates share the first LSH band with the query but little else
+    for index in range(1200):
+        unrelated = signature.copy()
+        unrelated[fingerprint.BAND_ROWS:] = rng.integers(0, 1 << 31, len(signature) - fingerprint.BAND_ROWS)
+        cache.put(f"unrelated-{index}", "test/1", {"tempo": 100.0}, unrelated)
+    near = signature.copy()
+    near[-8:] += 1
+    cache.put("near", "test/1", {"tempo": 120.0}, near)
+
+    result, digest = cache.find_duplicate(signature, "test/1")
+    cache.close()
+    assert digest == "near"
+    assert result["tempo"] == 120.0